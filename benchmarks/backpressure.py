@@ -0,0 +1,39 @@
+"""Backpressure: read interval scale of a source as its sink's buffer fills."""
+
+import logging
+
+import common
+import Cargo
+import emonhub_interfacer as ehi
+import emonhub_router as ehr
+
+logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+src = ehi.EmonHubInterfacer('src')
+src._settings['pubchannels'] = ['A']
+sink = ehi.EmonHubInterfacer('sink')
+sink._settings['subchannels'] = ['A']
+sink.init_buffer(buffer_size=10)
+router = ehr.EmonHubRouter()
+router.update({'src': src, 'sink': sink})
+
+for i in range(10):
+    src.publish(Cargo.new_cargo(realdata=[1]))
+    router.route()
+    for cargo in sink._sub_channels['A'].get_all():
+        sink.add(cargo)
+    print("%d buffered: read interval x%d" % (sink.buffer.size(), src.read_interval_scale()))
+
+sink.buffer.discardLastRetrievedItems(10)
+router.route()
+print("drained: read interval x%d" % src.read_interval_scale())
+
+
+# A full sink that keeps failing still slows the source, its buffer is
+# what protects the readings until the server is back
+for i in range(10):
+    sink.buffer.storeItem([i])
+for i in range(sink._retry.failures):
+    sink._retry.failure()
+router.route()
+print("sink full but unreachable: read interval x%d" % src.read_interval_scale())
@@ -0,0 +1,112 @@
+"""
+
+  Minimal MQTT 3.1.1 broker for the MQTT benchmarks.
+
+  Acknowledges every packet, counts the publishes it has completed, keeps
+  the payloads published under emon/JSON and can send messages to its
+  clients. Enough to measure the interfacer without a real broker.
+
+"""
+
+import socket
+import struct
+import threading
+
+
+def _varint(n):
+    out = b''
+    while True:
+        b = n % 128
+        n //= 128
+        out += bytes([b | (128 if n else 0)])
+        if not n:
+            return out
+
+
+class Broker:
+
+    def __init__(self, port=0):
+        self.srv = socket.socket()
+        self.srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.srv.bind(('127.0.0.1', port))
+        self.srv.listen(5)
+        self.port = self.srv.getsockname()[1]
+
+        # Publishes completed (acked at their QoS), and emon/JSON payloads
+        self.done = 0
+        self.json = []
+
+        self.lock = threading.Lock()
+        self.conns = []
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def send(self, topic, payload):
+        """Publish payload at QoS 0 to every connected client."""
+        t = topic.encode()
+        body = struct.pack('>H', len(t)) + t + payload.encode()
+        for c in list(self.conns):
+            try:
+                c.sendall(b'\x30' + _varint(len(body)) + body)
+            except OSError:
+                pass
+
+    def _accept(self):
+        while True:
+            c, _ = self.srv.accept()
+            c.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.conns.append(c)
+            threading.Thread(target=self._serve, args=(c,), daemon=True).start()
+
+    def _read(self, c, n):
+        b = b''
+        while len(b) < n:
+            d = c.recv(n - len(b))
+            if not d:
+                raise EOFError
+            b += d
+        return b
+
+    def _completed(self):
+        with self.lock:
+            self.done += 1
+
+    def _serve(self, c):
+        try:
+            while True:
+                header = self._read(c, 1)[0]
+                length, mult = 0, 1
+                while True:
+                    x = self._read(c, 1)[0]
+                    length += (x & 127) * mult
+                    mult *= 128
+                    if not x & 128:
+                        break
+                body = self._read(c, length) if length else b''
+
+                kind = header >> 4
+                if kind == 1:       # CONNECT
+                    c.sendall(b'\x20\x02\x00\x00')
+                elif kind == 8:     # SUBSCRIBE
+                    c.sendall(b'\x90\x03' + body[:2] + b'\x00')
+                elif kind == 12:    # PINGREQ
+                    c.sendall(b'\xd0\x00')
+                elif kind == 3:     # PUBLISH
+                    qos = (header >> 1) & 3
+                    tl = struct.unpack('>H', body[:2])[0]
+                    if body[2:2 + tl].startswith(b'emon/JSON'):
+                        self.json.append(body[2 + tl + (2 if qos else 0):])
+                    mid = body[2 + tl:4 + tl]
+                    if qos == 0:
+                        self._completed()
+                    elif qos == 1:
+                        c.sendall(b'\x40\x02' + mid)
+                        self._completed()
+                    else:
+                        c.sendall(b'\x50\x02' + mid)
+                elif kind == 6:     # PUBREL
+                    c.sendall(b'\x70\x02' + body[:2])
+                    self._completed()
+                elif kind == 14:    # DISCONNECT
+                    return
+        except (EOFError, OSError):
+            pass
@@ -0,0 +1,42 @@
+"""Cargo: creation time and size, and unique ids across threads."""
+
+import statistics
+import sys
+import threading
+import timeit
+
+import common
+import Cargo
+
+old = common.load_module('src/Cargo.py', common.baseline())
+
+# Old and new timed in turn, median of 15 runs each
+times = {'old': [], 'new': []}
+for i in range(15):
+    for label, module in (('old', old), ('new', Cargo)):
+        times[label].append(timeit.timeit(lambda: module.new_cargo(nodeid=10, realdata=[1, 2, 3]), number=100000) / 0.1)
+for label, module in (('old', old), ('new', Cargo)):
+    c = module.new_cargo(nodeid=10, realdata=[1, 2, 3], names=['a', 'b', 'c'])
+    size = sys.getsizeof(c) + (sys.getsizeof(c.__dict__) if hasattr(c, '__dict__') else 0)
+    print("%s: new_cargo %.2f us, %d bytes" % (label, statistics.median(times[label]), size))
+
+# Frozen cargo refuses changes, overlays share it
+c = Cargo.new_cargo(nodeid=10, realdata=[1, 2, 3]).freeze()
+try:
+    c.nodeid = 11
+    frozen = False
+except AttributeError:
+    frozen = True
+view = c.overlay(encoded={'x': 1})
+print("frozen cargo read-only: %s, overlay shares realdata: %s" % (frozen, view.realdata is c.realdata))
+
+ids = []
+def create():
+    for _ in range(50000):
+        ids.append(Cargo.new_cargo().uri)
+threads = [threading.Thread(target=create) for _ in range(4)]
+for t in threads:
+    t.start()
+for t in threads:
+    t.join()
+print("ids unique across 4 threads: %s" % (len(set(ids)) == len(ids)))
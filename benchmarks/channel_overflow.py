@@ -0,0 +1,27 @@
+"""Channel overflow policies: what a full channel keeps, and how long block waits."""
+
+import threading
+import time
+
+import common
+from emonhub_interfacer import EmonHubChannel
+
+for args in (('drop_oldest',), ('drop_newest',), ('block', 0.2)):
+    c = EmonHubChannel('t', 3, *args)
+    t = time.perf_counter()
+    discarded = c.put_many(range(5))
+    print("%-11s put 5 into 3: discarded %d, kept %s, %.2f s"
+          % (args[0], discarded, c.get_all(), time.perf_counter() - t))
+
+# A reader draining the channel lets a blocked publisher through
+c = EmonHubChannel('t', 3, 'block', 2)
+threading.Timer(0.1, c.get_all).start()
+t = time.perf_counter()
+discarded = c.put_many(range(5))
+print("block, drained after 0.1 s: discarded %d in %.2f s" % (discarded, time.perf_counter() - t))
+
+# The router never waits on a full channel
+c = EmonHubChannel('t', 3, 'block', 2)
+t = time.perf_counter()
+discarded = c.put_many(range(5), block=False)
+print("block, from the router: discarded %d in %.2f s" % (discarded, time.perf_counter() - t))
@@ -0,0 +1,40 @@
+"""Struct cache: decoding an emonTx frame value by value, and in one unpack."""
+
+import random
+import struct
+import timeit
+
+import common
+import emonhub_coder as new
+
+old = common.load_module('src/emonhub_coder.py', common.baseline())
+
+random.seed(1)
+datacodes = ['L'] + ['h'] * 12 + ['l'] * 6
+values = [123] + [random.randint(-3000, 3000) for _ in range(12)] + [random.randint(0, 10**6) for _ in range(6)]
+frame = list(struct.pack('<' + ''.join(datacodes), *values))
+frame_bytes = bytes(frame)
+
+def per_value(coder):
+    def decode():
+        out = []
+        i = 0
+        for dc in datacodes:
+            n = coder.check_datacode(dc)
+            out.append(coder.decode(dc, frame[i:i + n]))
+            i += n
+        return out
+    return decode
+
+assert per_value(old)() == per_value(new)() == new.decode_many(datacodes, frame) \
+    == list(new.decode_bytes(datacodes, frame_bytes)) == values
+for v, dcs in ((1, 'hL'), (70000, 'L'), (-5, 'h')):
+    for dc in dcs:
+        assert old.encode(dc, v) == new.encode(dc, v)
+
+n = 20000
+for label, decode in (('old per value', per_value(old)),
+                      ('new per value', per_value(new)),
+                      ('decode_many', lambda: new.decode_many(datacodes, frame)),
+                      ('decode_bytes', lambda: new.decode_bytes(datacodes, frame_bytes))):
+    print("%-14s %.2f us/frame" % (label, min(timeit.repeat(decode, number=n, repeat=5)) / n * 1e6))
@@ -0,0 +1,75 @@
+"""
+
+  Helpers shared by the benchmark scripts.
+
+  Puts src/ on the import path, and loads modules as they were at a given
+  git revision so the scripts can compare the old and new code side by side.
+
+"""
+
+import importlib.util
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SRC = os.path.join(ROOT, 'src')
+
+sys.path.insert(0, os.path.join(SRC, 'interfacers'))
+sys.path.insert(0, SRC)
+
+
+def git(*args):
+    return subprocess.run(('git', '-C', ROOT) + args, check=True,
+                          stdout=subprocess.PIPE, universal_newlines=True).stdout
+
+
+def baseline():
+    """Return the git revision to compare against, given on the command line.
+
+    e.g. python3 benchmarks/coder.py <revision>
+
+    """
+    if len(sys.argv) != 2:
+        sys.exit("usage: %s <revision>\n"
+                 "  revision: git revision of the code to compare against"
+                 % os.path.basename(sys.argv[0]))
+    return sys.argv[1]
+
+
+def load_module(path, revision=None, name=None):
+    """Load a module by its path in the repo, as of revision if given.
+
+    path (string): e.g. 'src/emonhub_coder.py'
+    revision (string): git revision, None for the working tree
+    name (string): module name, registered in sys.modules if given
+
+    """
+    source = os.path.join(ROOT, path)
+    tmp = None
+    if revision:
+        fd, tmp = tempfile.mkstemp(suffix='.py')
+        with os.fdopen(fd, 'w') as f:
+            f.write(git('show', '%s:%s' % (revision, path)))
+        source = tmp
+    try:
+        spec = importlib.util.spec_from_file_location(name or 'bench_%x' % id(source), source)
+        module = importlib.util.module_from_spec(spec)
+        if name:
+            sys.modules[name] = module
+        spec.loader.exec_module(module)
+    finally:
+        if tmp:
+            os.remove(tmp)
+    return module
+
+
+def free_port():
+    """Return a local TCP port nothing is listening on."""
+    import socket
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
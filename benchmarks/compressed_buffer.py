@@ -0,0 +1,103 @@
+"""Compressed buffer: CompressedBuffer against a deque model, and RAM for a 3 day backlog."""
+
+import collections
+import logging
+import random
+import time
+import tracemalloc
+
+import common
+import emonhub_buffer as ehb
+
+logging.disable(logging.CRITICAL)
+
+def frame(i):
+    r = random.random()
+    if r < 0.05:
+        return {'topic': 'x', 'payload': i}
+    if r < 0.1:
+        return [1700000000.0 + i * 10, 5, float('nan'), 7]
+    if r < 0.15:
+        return [1700000000 + i * 10, 5, 2**60, 1]
+    if r < 0.2:
+        return [1700000000.5 + i * 10, 6, 0.1, 230.25]
+    return [1700000000.0 + i * 10 + random.random(), random.randrange(30), random.randrange(-5000, 5000),
+            random.randrange(100) / 4, 230.0]
+
+def same(a, b):
+    """Compare lists of frames, timestamps to 1 us and NaN equal to NaN."""
+    if len(a) != len(b):
+        return False
+    for x, y in zip(a, b):
+        if isinstance(x, list):
+            if len(x) != len(y) or abs(x[0] - y[0]) > 1e-6:
+                return False
+            if any(not (u == v or (u != u and v != v)) for u, v in zip(x[1:], y[1:])):
+                return False
+        elif x != y:
+            return False
+    return True
+
+random.seed(7)
+for capacity, block_size in ((5, 2), (40, 7), (300, 64)):
+    b = ehb.CompressedBuffer('c', capacity, block_size=block_size)
+    model = collections.deque(maxlen=capacity)
+    for i in range(20000):
+        op = random.random()
+        if op < 0.5:
+            x = frame(i)
+            b.storeItem(x)
+            model.append(x)
+        elif op < 0.85:
+            k = random.randrange(0, capacity + 3)
+            assert same(b.retrieveItems(k), list(model)[:k])
+            if random.random() < 0.7:
+                j = random.randrange(0, k + 1)
+                b.discardLastRetrievedItems(j)
+                for _ in range(min(j, len(model))):
+                    model.popleft()
+        else:
+            k = random.randrange(0, capacity + 3)
+            b.discardLastRetrievedItems(k)
+            for _ in range(min(k, len(model))):
+                model.popleft()
+        assert b.size() == len(model)
+print("compressed buffer matches a deque")
+
+# 3 day outage of 6 emonTx posting every 10 s
+n = 3 * 8640 * 6
+def emontx_frames():
+    t = 1700000000.0
+    energy = [0] * 6
+    for i in range(n):
+        node = i % 6
+        t += 10 / 6
+        energy[node] += random.randrange(0, 50)
+        yield ([t + random.random() * 0.01, 10 + node] + [float(random.randrange(0, 3000)) for _ in range(6)]
+               + [energy[node] / 1.0, 230.0 + random.randrange(-50, 50) / 10, -60.0])
+
+for label, create in (('memory', lambda: ehb.InMemoryBuffer('m', n)),
+                      ('compressed', lambda: ehb.CompressedBuffer('c', n))):
+    # Frames are created while tracing, as the memory buffer keeps them
+    random.seed(8)
+    tracemalloc.start()
+    b = create()
+    for f in emontx_frames():
+        b.storeItem(f)
+    ram = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    t = time.perf_counter()
+    while b.hasItems():
+        b.discardLastRetrievedItems(len(b.retrieveItems(1000)))
+    drain = time.perf_counter() - t
+
+    random.seed(8)
+    frames = list(emontx_frames())
+    b = create()
+    t = time.perf_counter()
+    for f in frames:
+        b.storeItem(f)
+    store = time.perf_counter() - t
+    del frames, b
+    print("%-10s %d frames: RAM %.1f MB, store %.1f us/frame, drain %.2f s"
+          % (label, n, ram / 1e6, store / n * 1e6, drain))
@@ -0,0 +1,89 @@
+"""
+
+  Local stand-in for the emoncms input/bulk API, for the HTTP benchmarks.
+
+  Accepts bulk posts, plain or compressed and whole or chunked, after a configurable delay and
+  keeps the frames received. It can fail a share of posts, or reject
+  batches above a size, to exercise retries and batch size adaptation.
+
+"""
+
+import gzip
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs
+
+
+class Emoncms:
+
+    def __init__(self, port=0, latency=0.2, latency_per_frame=0.0, fail=0.0, max_frames=None):
+        self.latency = latency
+        self.latency_per_frame = latency_per_frame
+        self.fail = fail
+        self.max_frames = max_frames
+        self.received = []
+        self.lock = threading.Lock()
+
+        emoncms = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.headers.get('Transfer-Encoding') == 'chunked':
+                    body = self.read_chunked()
+                    if body is None:
+                        # Client gave up half way through
+                        return
+                else:
+                    body = self.rfile.read(int(self.headers['Content-Length']))
+                if self.headers.get('Content-Encoding') == 'gzip':
+                    body = gzip.decompress(body)
+                if 'cb=1' in self.path:
+                    data = json.loads(zlib.decompress(body))
+                else:
+                    data = json.loads(parse_qs(body.decode())['data'][0])
+                self.send_response(emoncms.handle(data))
+                self.end_headers()
+                self.wfile.write(b'ok')
+
+            def read_chunked(self):
+                body = b''
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return None
+                    size = int(line.split(b';')[0], 16)
+                    body += self.rfile.read(size)
+                    self.rfile.readline()
+                    if not size:
+                        return body
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def handle(self, data):
+        """Return the HTTP status for a bulk post of data."""
+        time.sleep(self.latency + len(data) * self.latency_per_frame)
+        if random.random() < self.fail:
+            return 500
+        if self.max_frames and len(data) > self.max_frames:
+            return 503
+        with self.lock:
+            self.received.extend(data)
+        return 200
+
+    def unique(self):
+        """Number of distinct frames received."""
+        with self.lock:
+            return len(set(tuple(f) for f in self.received))
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
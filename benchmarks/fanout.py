@@ -0,0 +1,57 @@
+"""Fan-out to several sinks: memory and time per frame, shared cargo against a copy per sink."""
+
+import logging
+import time
+import tracemalloc
+
+import common
+import Cargo
+import emonhub_interfacer as ehi
+import emonhub_router as ehr
+
+logging.getLogger("EmonHub").setLevel(logging.WARNING)
+
+
+class Sink(ehi.EmonHubInterfacer):
+
+    def __init__(self, name, copies):
+        super().__init__(name)
+        self.copies = copies
+        self.kept = []
+
+    def add(self, cargo):
+        if self.copies:
+            # What each sink held before cargo was shared
+            cargo = cargo.overlay(frozen=False, names=list(cargo.names),
+                                  realdata=list(cargo.realdata), encoded={})
+        self.kept.append(self._process_tx(cargo))
+
+
+def run(nsinks, copies, frames=2000):
+    src = ehi.EmonHubInterfacer('src')
+    src._settings['pubchannels'] = ['A']
+    src._settings['channel_size'] = 10**6
+    sinks = {'s%d' % i: Sink('s%d' % i, copies) for i in range(nsinks)}
+    for sink in sinks.values():
+        sink._settings['subchannels'] = ['A']
+    router = ehr.EmonHubRouter()
+    router.update(dict(src=src, **sinks))
+
+    tracemalloc.start()
+    t = time.perf_counter()
+    for _ in range(frames):
+        src.publish(Cargo.new_cargo(nodeid=10, realdata=[100, 200, 300, 400, 5000, 12, 13, 14], names=['a'] * 8))
+        router.route()
+        for sink in sinks.values():
+            for cargo in sink._sub_channels['A'].get_all():
+                sink.add(cargo)
+    dt = time.perf_counter() - t
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print("%-6s %d sinks: %5d bytes retained/frame, %.1f us/frame"
+          % ('copy' if copies else 'shared', nsinks, retained / frames, dt / frames * 1e6))
+
+
+for nsinks in (1, 4, 8):
+    for copies in (True, False):
+        run(nsinks, copies)
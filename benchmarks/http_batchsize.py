@@ -0,0 +1,37 @@
+"""Adaptive batch size: time to send a 100000 frame backlog, fixed against adaptive batches."""
+
+import logging
+import time
+
+import common
+import Cargo
+from EmonHubEmoncmsHTTPInterfacer import EmonHubEmoncmsHTTPInterfacer
+from emoncms import Emoncms
+
+logging.basicConfig(level=logging.INFO, format='%(message)s')
+logging.getLogger('urllib3').setLevel(logging.ERROR)
+log = logging.getLogger('EmonHub')
+# Keep the batch size changes, not every post
+log.addFilter(lambda record: not record.getMessage().startswith('sending:'))
+
+
+def run(n, max_frames=None, **settings):
+    emoncms = Emoncms(latency_per_frame=0.00002, max_frames=max_frames)
+    log.setLevel(logging.WARNING)
+    I = EmonHubEmoncmsHTTPInterfacer('http')
+    I.set(apikey='a' * 32, url=emoncms.url, interval='1', **settings)
+    for i in range(n):
+        I.add(Cargo.new_cargo(nodeid=5, realdata=[i, 1.5], timestamp=1e9 + i))
+    log.setLevel(logging.INFO)
+    t = time.time()
+    while I.buffer.hasItems() or I._inflight:
+        I.action()
+        time.sleep(0.005)
+    I.action()
+    emoncms.close()
+    return time.time() - t, emoncms.unique()
+
+
+print("fixed 1000: %.1f s, %d frames" % run(100000, min_batchsize='1000', max_batchsize='1000'))
+print("adaptive: %.1f s, %d frames" % run(100000))
+print("adaptive, server rejects over 3000: %.1f s, %d frames" % run(100000, max_frames=3000))
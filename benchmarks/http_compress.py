@@ -0,0 +1,50 @@
+"""Streamed compression: peak memory and time to compress bulk posts, and round trips."""
+
+import json
+import logging
+import random
+import time
+import tracemalloc
+import zlib
+from urllib.parse import quote_plus
+
+import common
+from EmonHubEmoncmsHTTPInterfacer import EmonHubEmoncmsHTTPInterfacer
+from emoncms import Emoncms
+
+logging.basicConfig(level=logging.WARNING)
+
+emoncms = Emoncms(latency=0)
+I = EmonHubEmoncmsHTTPInterfacer('http')
+I.set(apikey='a' * 32, url=emoncms.url)
+
+random.seed(1)
+for n in (100, 1000, 10000):
+    data = [[1700000000 + 10 * i, 10, round(random.uniform(0, 3000), 1), round(random.uniform(0, 3000), 1),
+             230.1 + random.random(), 18.5, 0, 0, 0, -45] for i in range(n)]
+
+    # Serializing the whole batch, then compressing it
+    tracemalloc.start()
+    t = time.perf_counter()
+    body = zlib.compress(json.dumps(data, separators=(',', ':'), allow_nan=False).encode())
+    dt = time.perf_counter() - t
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print("%5d frames, whole string: %7.1f kB peak %6.1f ms, %d bytes" % (n, peak / 1e3, dt * 1e3, len(body)))
+
+    for label, args in (('zlib', (15,)), ('gzip', (31, 'data=', quote_plus))):
+        tracemalloc.start()
+        t = time.perf_counter()
+        # Chunks taken one at a time, as they are sent
+        size = sum(len(chunk) for chunk in I._compress_frames(data, *args))
+        dt = time.perf_counter() - t
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print("%5d frames, streamed %s: %7.1f kB peak %6.1f ms, %d bytes" % (n, label, peak / 1e3, dt * 1e3, size))
+
+    for compress in ('0', '1', 'gzip'):
+        I.set(apikey='a' * 32, url=emoncms.url, compress=compress)
+        emoncms.received.clear()
+        assert I._process_post(data) and emoncms.received == data, compress
+print("round trips ok")
+emoncms.close()
@@ -0,0 +1,41 @@
+"""Pipelined posting: time to send a backlog with 1 to 8 posts in flight over a 200 ms link."""
+
+import logging
+import time
+
+import common
+import Cargo
+from EmonHubEmoncmsHTTPInterfacer import EmonHubEmoncmsHTTPInterfacer
+from emoncms import Emoncms
+
+logging.disable(logging.CRITICAL)
+
+
+def run(max_inflight, n, fail=0.0, live=False):
+    emoncms = Emoncms(fail=fail)
+    I = EmonHubEmoncmsHTTPInterfacer('http')
+    I.set(apikey='a' * 32, url=emoncms.url, max_inflight=str(max_inflight), interval='1', senddata='1',
+          min_batchsize='1000', max_batchsize='1000', retry_interval='1')
+    for i in range(n):
+        I.add(Cargo.new_cargo(nodeid=5, realdata=[i, 1.5], timestamp=1e9 + i))
+    t = time.time()
+    extra = 0
+    while I.buffer.hasItems() or I._inflight:
+        I.action()
+        time.sleep(0.005)
+        if live and extra < 200:
+            I.add(Cargo.new_cargo(nodeid=6, realdata=[extra], timestamp=2e9 + extra))
+            extra += 1
+    dt = time.time() - t
+    if I._executor:
+        I._executor.shutdown()
+    emoncms.close()
+    return dt, len(emoncms.received), emoncms.unique(), n + extra
+
+
+for max_inflight in (1, 4, 8):
+    dt, received, unique, n = run(max_inflight, 20000)
+    print("max_inflight %d: 20 posts of 1000 frames in %.2f s, %d/%d frames" % (max_inflight, dt, unique, n))
+
+dt, received, unique, n = run(4, 20000, fail=0.3, live=True)
+print("30%% of posts failing, with live data: %.1f s, received %d, %d/%d frames" % (dt, received, unique, n))
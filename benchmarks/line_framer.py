@@ -0,0 +1,78 @@
+"""Line framing: splitting 30000 emonPi lines read in small chunks."""
+
+import time
+
+import common
+from emonhub_reactor import EmonHubLineFramer
+
+line = b"OK 5 12 0 34 1 56 0 78 0 210 95 0 0 0 0 0 0 0 0 0 0 0 0 (-52)\r\n"
+stream = line * 30000
+# Lines split across reads
+chunks = [stream[i:i + 97] for i in range(0, len(stream), 97)]
+
+
+def old(chunks):
+    """The old read(): append the decoded bytes, take a frame once '\\r\\n' is in them."""
+    out, buf = [], ''
+    for c in chunks:
+        buf = buf + c.decode()
+        if '\r\n' not in buf:
+            continue
+        out.append(buf[:-2])
+        buf = ''
+    return out
+
+
+def str_split(chunks):
+    """A string buffer that keeps every line, for comparison."""
+    out, buf = [], ''
+    for c in chunks:
+        buf = buf + c.decode()
+        if '\r\n' in buf:
+            lines = buf.split('\r\n')
+            buf = lines.pop()
+            out.extend(lines)
+    return out
+
+
+def newline_split(chunks):
+    """The reactor's first framing: split on '\n', then strip any '\r'."""
+    out, buf = [], bytearray()
+    for data in chunks:
+        buf += data
+        end = buf.rfind(b"\n")
+        if end < 0:
+            continue
+        lines = bytes(buf[:end]).split(b"\n")
+        del buf[:end + 1]
+        out.extend([l[:-1] if l.endswith(b"\r") else l for l in lines])
+    return out
+
+
+def framer(chunks):
+    out, fr = [], EmonHubLineFramer()
+    for c in chunks:
+        out.extend(fr.feed(c))
+    return out
+
+
+def best(f, chunks, repeat=5):
+    dt = 1e9
+    for _ in range(repeat):
+        t = time.perf_counter()
+        lines = f(chunks)
+        dt = min(dt, time.perf_counter() - t)
+    return dt, lines
+
+
+# Lines recovered, decoded as the interfacers use them
+expected = line[:-2]
+for f in (old, str_split, newline_split, framer):
+    lines = [l.encode() if isinstance(l, str) else l for l in f(chunks)]
+    print("%-13s %d lines, %d intact of 30000" % (f.__name__, len(lines), lines.count(expected)))
+
+# Framing alone, lines left as bytes
+for size in (97, 4096):
+    sized = [stream[i:i + size] for i in range(0, len(stream), size)]
+    print("%4d byte reads: %s" % (size, ", ".join(
+        "%s %.1f ms" % (f.__name__, best(f, sized)[0] * 1e3) for f in (newline_split, framer))))
@@ -0,0 +1,46 @@
+"""Ring buffer: InMemoryBuffer against a deque model, and draining a day's backlog."""
+
+import collections
+import logging
+import random
+import time
+
+import common
+import emonhub_buffer as ehb
+
+logging.disable(logging.CRITICAL)
+
+random.seed(3)
+for capacity in (1, 2, 5, 17):
+    b = ehb.InMemoryBuffer('t', capacity)
+    model = collections.deque(maxlen=capacity)
+    for _ in range(20000):
+        op = random.random()
+        if op < 0.5:
+            x = random.random()
+            b.storeItem(x)
+            model.append(x)
+        elif op < 0.8:
+            k = random.randrange(0, capacity + 3)
+            assert b.retrieveItems(k) == list(model)[:k]
+        else:
+            k = random.randrange(0, capacity + 3)
+            b.discardLastRetrievedItems(k)
+            for _ in range(min(k, len(model))):
+                model.popleft()
+        assert b.size() == len(model) and b.hasItems() == bool(model)
+print("ring buffer matches a deque")
+
+# 24 h outage of 10 nodes posting every 10 s, drained 1000 frames per flush
+old = common.load_module('src/emonhub_buffer.py', common.baseline())
+frame = [1700000000.0, 10] + [123.4] * 12
+for label, module in (('old list', old), ('ring', ehb)):
+    b = module.InMemoryBuffer('http', 100000)
+    for i in range(86400):
+        b.storeItem(frame)
+    t = time.perf_counter()
+    flushes = 0
+    while b.hasItems():
+        b.discardLastRetrievedItems(len(b.retrieveItems(1000)))
+        flushes += 1
+    print("%-8s drain 86400 frames in %d flushes: %.1f ms" % (label, flushes, (time.perf_counter() - t) * 1e3))
@@ -0,0 +1,35 @@
+"""MQTT topic cache: time to format and publish a frame in every format.
+
+Any revision can be given, revisions from before _publish_frame are timed
+through _process_post, e.g. python3 benchmarks/mqtt_cache.py <revision>
+
+"""
+
+import time
+
+import common
+import EmonHubMqttInterfacer as new
+
+old = common.load_module('src/interfacers/EmonHubMqttInterfacer.py', common.baseline())
+
+frames = [{'nodeid': n, 'node': 'node%d' % n, 'names': tuple('in%d' % i for i in range(30)),
+           'data': tuple(float(i) for i in range(30)), 'timestamp': 1.0, 'rssi': -50} for n in range(20)]
+
+for label, module in (('old', old), ('new', new)):
+    I = module.EmonHubMqttInterfacer('MQTT')
+    I.set(node_format_enable='1', nodevar_format_enable='1', node_JSON_enable='1')
+    # Time the formatting, not the client
+    info = (0, 1)
+    I._mqttc.publish = lambda *args, **kwargs: info
+    if hasattr(I, '_publish_frame'):
+        publish = I._publish_frame
+    else:
+        # Before _publish_frame, frames were formatted and published by
+        # _process_post once connected
+        I._connected = True
+        publish = lambda frame: I._process_post([frame])
+    N = 20000
+    t = time.perf_counter()
+    for k in range(N):
+        publish(frames[k % 20])
+    print("%s: %.1f us/frame" % (label, (time.perf_counter() - t) / N * 1e6))
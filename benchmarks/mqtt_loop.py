@@ -0,0 +1,84 @@
+"""MQTT network thread: control message latency and sustained publish rate.
+
+Old clients that publish to plain lists rather than channels are read as
+such. The old client gets 60 s to send the frames, the script exits with
+an error if a client does not connect or receive control messages.
+
+"""
+
+import logging
+import statistics
+import sys
+import time
+import warnings
+
+import common
+import Cargo
+import EmonHubMqttInterfacer as new
+from broker import Broker
+
+warnings.simplefilter('ignore')
+logging.basicConfig(level=logging.WARNING)
+
+old = common.load_module('src/interfacers/EmonHubMqttInterfacer.py', common.baseline())
+
+
+def wait(condition, what, timeout=10):
+    """Wait until condition() is true, exit with an error after timeout seconds."""
+    t = time.time()
+    while not condition():
+        if time.time() - t > timeout:
+            sys.exit("%s: gave up after %d s waiting for %s" % (sys.argv[0], timeout, what))
+        time.sleep(0.0002)
+
+
+def ready(I, channel):
+    channel = I._pub_channels.get(channel)
+    if isinstance(channel, list):
+        # Old clients publish to plain lists
+        received = bool(channel)
+        channel.clear()
+        return received
+    return channel and channel.get_all()
+
+
+def run(module, label, **settings):
+    broker = Broker()
+    I = module.EmonHubMqttInterfacer('mqtt', mqtt_host='127.0.0.1', mqtt_port=broker.port)
+    I.set(nodevar_format_enable='1', pubchannels=['ToRFM12'], subchannels=['ToEmonCMS'], channel_size='100000', **settings)
+    # Lets the script exit if the client gets stuck
+    I.daemon = True
+    I.start()
+    I.deliver('ToEmonCMS', [Cargo.new_cargo(nodeid=1, realdata=[0])])
+    wait(lambda: I._connected, "the %s client to connect" % label)
+    time.sleep(0.3)
+
+    # Round trip of a control message from the broker to the pub channel
+    latency = []
+    for i in range(40):
+        time.sleep(0.037)
+        t = time.perf_counter()
+        broker.send('emonhub/tx/5/values', '1,2,3')
+        wait(lambda: ready(I, 'ToRFM12'), "a control message to reach the %s client" % label)
+        latency.append((time.perf_counter() - t) * 1e3)
+
+    # Sustained publishing, 3000 frames of 30 values
+    broker.done = 0
+    n = 3000
+    frames = [Cargo.new_cargo(nodeid=5, realdata=list(range(30)), names=['p%d' % i for i in range(30)]) for _ in range(n)]
+    t = time.time()
+    for i in range(0, n, 30):
+        I.deliver('ToEmonCMS', frames[i:i + 30])
+        time.sleep(0.01)
+    while broker.done < n * 31 and time.time() - t < 60:
+        time.sleep(0.005)
+    dt = time.time() - t
+    I.stop = True
+    I.join(2)
+    print("%-9s control round trip median %.1f ms, max %.1f ms; %d msgs in %.2f s = %.0f msg/s"
+          % (label, statistics.median(latency), max(latency), broker.done, dt, broker.done / dt))
+
+
+for qos in ('2', '0'):
+    run(old, 'old qos ' + qos, nodevar_format_qos=qos, node_format_qos=qos)
+    run(new, 'new qos ' + qos, nodevar_format_qos=qos, node_format_qos=qos, max_queued='200000')
@@ -0,0 +1,49 @@
+"""MQTT offline queue: frames buffered while the broker is down, and their replay."""
+
+import json
+import logging
+import tempfile
+import time
+import warnings
+
+import common
+import Cargo
+from EmonHubMqttInterfacer import EmonHubMqttInterfacer
+from broker import Broker
+
+warnings.simplefilter('ignore')
+logging.basicConfig(level=logging.WARNING, format='%(relativeCreated)6d %(message)s')
+
+with tempfile.TemporaryDirectory() as path:
+    for buffer_settings in ({}, {'buffer_type': 'sqlite', 'buffer_path': path, 'buffer_commit_interval': '1'}):
+        port = common.free_port()
+        I = EmonHubMqttInterfacer('mqtt', mqtt_host='127.0.0.1', mqtt_port=port)
+        I.set(nodevar_format_enable='1', node_JSON_enable='1', node_JSON_basetopic='emon/JSON/',
+              subchannels=['ToEmonCMS'], retry_interval='1', retry_max_interval='2')
+        I.init_buffer(**buffer_settings)
+        I.start()
+
+        # Broker down for 4 s
+        n = 0
+        t = time.time()
+        while time.time() - t < 4:
+            I.deliver('ToEmonCMS', [Cargo.new_cargo(nodeid=5, realdata=[i, 1.5, 2.5], names=['a', 'b', 'c'], timestamp=1e9 + i)
+                                    for i in range(n, n + 5)])
+            n += 5
+            time.sleep(0.01)
+        buffered = I.buffer.size()
+
+        broker = Broker(port)
+        while not I._connected:
+            time.sleep(0.005)
+        t = time.time()
+        while len(broker.json) < n and time.time() - t < 30:
+            time.sleep(0.005)
+        times = [json.loads(p)['time'] for p in broker.json]
+        # Each frame is 5 messages: 3 values and the node and JSON formats
+        print("%-6s: %d frames buffered while down, %d replayed (%d msgs, %d expected) in %.2f s, in order: %s, original timestamps: %s"
+              % (buffer_settings.get('buffer_type', 'memory'), buffered, len(times), broker.done, 5 * n, time.time() - t,
+                 times == sorted(times) and len(set(times)) == len(times), times[0] == 1e9))
+        I.stop = True
+        I.join(3)
+        I.buffer.close()
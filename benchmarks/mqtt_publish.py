@@ -0,0 +1,63 @@
+"""Batched MQTT publishing: messages acked by a local broker at 50 and 150 frames/s."""
+
+import logging
+import time
+import warnings
+
+import common
+import Cargo
+import EmonHubMqttInterfacer as new
+from broker import Broker
+
+warnings.simplefilter('ignore')
+logging.basicConfig(level=logging.WARNING)
+
+old = common.load_module('src/interfacers/EmonHubMqttInterfacer.py', common.baseline())
+
+
+def run(module, frames_per_s, seconds=5, nvalues=30, **settings):
+    broker = Broker()
+    I = module.EmonHubMqttInterfacer('mqtt', mqtt_host='127.0.0.1', mqtt_port=broker.port)
+    I.set(nodevar_format_enable='1', subchannels=['ToEmonCMS'], channel_size='100000', **settings)
+    I.start()
+
+    # Connect
+    I.deliver('ToEmonCMS', [Cargo.new_cargo(nodeid=1, realdata=[0])])
+    time.sleep(1)
+    broker.done = 0
+
+    # Frames delivered every 100 ms
+    c0 = time.process_time()
+    t0 = time.time()
+    sent = 0
+    owed = 0.0
+    while time.time() - t0 < seconds:
+        owed += frames_per_s / 10
+        cargos = []
+        while owed >= 1:
+            cargos.append(Cargo.new_cargo(nodeid=5, realdata=list(range(nvalues)), names=['p%d' % i for i in range(nvalues)]))
+            owed -= 1
+        I.deliver('ToEmonCMS', cargos)
+        sent += len(cargos)
+        time.sleep(0.1)
+
+    # Time to catch up once frames stop arriving
+    msgs = sent * (nvalues + 1)
+    t1 = time.time()
+    while broker.done < msgs and time.time() - t1 < 30:
+        time.sleep(0.01)
+    lag = time.time() - t1
+    cpu = (time.process_time() - c0) / max(broker.done, 1) * 1e6
+    I.stop = True
+    I.join(2)
+    return msgs, broker.done, lag, cpu
+
+
+for label, module, settings in (('old qos 2', old, {}),
+                                ('new qos 2', new, {}),
+                                ('new qos 2, max_inflight 200', new, {'max_inflight': '200'}),
+                                ('new qos 0', new, {'nodevar_format_qos': '0', 'node_format_qos': '0'})):
+    for frames_per_s in (50, 150):
+        msgs, done, lag, cpu = run(module, frames_per_s, **settings)
+        print("%-28s %3d frames/s (%4d msg/s): %5d/%5d msgs acked, %.1f s to catch up, %.0f us CPU/msg"
+              % (label, frames_per_s, frames_per_s * 31, done, msgs, lag, cpu))
@@ -0,0 +1,72 @@
+"""Per-node decoders: _process_rx old against new, same output and time per frame."""
+
+import copy
+import logging
+import random
+import sys
+import time
+
+import common
+import Cargo
+import emonhub_coder as ehc
+import emonhub_interfacer as new
+
+# The old interfacer with the coder of its time
+revision = common.baseline()
+current_coder = sys.modules['emonhub_coder']
+old_coder = common.load_module('src/emonhub_coder.py', revision, 'emonhub_coder')
+old = common.load_module('src/emonhub_interfacer.py', revision, 'old_emonhub_interfacer')
+sys.modules['emonhub_coder'] = current_coder
+
+nodes = {
+    '1': {'nodename': 'a', 'rx': {'names': ['MSG', 'p1', 'p2'], 'datacodes': ['L', 'h', 'h'], 'scales': ['1', '0.1', 1]}},
+    '2': {'nodename': 'b', 'rx': {'datacode': 'h', 'scale': '0.01'}},
+    '3': {'rx': {'datacode': 'h', 'scales': ['0.1', '1']}},
+    '4': {'rx': {'datacode': '0'}},
+    '5': {'rx': {'datacode': 'h', 'whitening': '1'}},
+    '6': {'rx': {'datacode': ['h']}},
+    '7': {'rx': {'datacodes': ['h', 'h']}},
+}
+
+def interfacer(module, datacode, scale):
+    I = module.EmonHubInterfacer('x')
+    I._settings['datacode'] = datacode
+    I._settings['scale'] = scale
+    I._settings['nodelistonly'] = False
+    return I
+
+def output(cargo):
+    return cargo and (cargo.nodename, list(cargo.names), list(cargo.realdata))
+
+random.seed(1)
+frames = []
+for i in range(3000):
+    node = random.choice(['1', '2', '3', '4', '5', '6', '7', '9'])
+    if node == '1':
+        data = [i % 256, 0, 0, 0] + [random.randrange(256) for _ in range(4)]
+    else:
+        data = [random.randrange(256) for _ in range(random.choice([4, 6, 8, 3, 2, 1]))]
+    if node == '4' or (node != '5' and random.random() < 0.05):
+        data = [str(x) for x in data]
+    frames.append((node, data))
+
+logging.disable(logging.CRITICAL)
+for datacode, scale in (('h', '1'), ('0', '1'), (0, '1'), ('B', '0.5')):
+    old_coder.nodelist = copy.deepcopy(nodes)
+    ehc.set_nodelist(copy.deepcopy(nodes))
+    a = interfacer(new, datacode, scale)
+    b = interfacer(old, datacode, scale)
+    for node, data in frames:
+        o1 = output(a._process_rx(Cargo.new_cargo(nodeid=int(node), realdata=list(data))))
+        o2 = output(b._process_rx(Cargo.new_cargo(nodeid=int(node), realdata=list(data))))
+        assert o1 == o2 or not (o1 or o2), (datacode, scale, node, data, o1, o2)
+print("old and new decode the same")
+
+decoded = [f for f in frames if f[0] in '123'][:1000]
+for label, module in (('old', old), ('new', new)):
+    I = interfacer(module, 'h', '1')
+    t = time.perf_counter()
+    for _ in range(20):
+        for node, data in decoded:
+            I._process_rx(Cargo.new_cargo(nodeid=int(node), realdata=list(data)))
+    print("%s: %.2f us/frame" % (label, (time.perf_counter() - t) / (20 * len(decoded)) * 1e6))
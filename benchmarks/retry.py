@@ -0,0 +1,43 @@
+"""Retry policy: attempts during a 6 h outage, and recovery once the server is back."""
+
+import logging
+import random
+import time
+
+import common
+import Cargo
+from emonhub_interfacer import EmonHubRetryPolicy
+from EmonHubEmoncmsHTTPInterfacer import EmonHubEmoncmsHTTPInterfacer
+from emoncms import Emoncms
+
+random.seed(0)
+for interval in (30, 5):
+    policy = EmonHubRetryPolicy('x')
+    attempts = 0
+    for t in range(3600 * 6):
+        if t % interval == 0 and policy.ready(t):
+            attempts += 1
+            policy.failure(t)
+    print("posting every %d s, 6 h outage: %d attempts without the policy, %d with" % (interval, 3600 * 6 // interval, attempts))
+
+# The server comes up after 8 s, frames are added every 50 ms throughout
+logging.basicConfig(level=logging.WARNING, format='%(relativeCreated)6d %(message)s')
+port = common.free_port()
+I = EmonHubEmoncmsHTTPInterfacer('http')
+I.set(apikey='a' * 32, url='http://127.0.0.1:%d' % port, interval='0', max_inflight='4',
+      retry_interval='1', retry_max_interval='3', retry_failures='3')
+logging.getLogger('EmonHub').setLevel(logging.INFO)
+emoncms = None
+t = time.time()
+i = 0
+while time.time() - t < 12:
+    I.add(Cargo.new_cargo(nodeid=5, realdata=[i], timestamp=1e9 + i))
+    i += 1
+    if emoncms is None and time.time() - t > 8:
+        emoncms = Emoncms(port, latency=0)
+        print("server up")
+    I.action()
+    time.sleep(0.05)
+print("%d frames added, %d received, %d buffered, circuit %s"
+      % (i, len(emoncms.received), I.buffer.size(), I._retry.state))
+emoncms.close()
@@ -0,0 +1,48 @@
+"""Router latency: time from publish() to the sink at 1 to 10000 frames/s."""
+
+import statistics
+import time
+
+import common
+import Cargo
+import emonhub_interfacer as ehi
+import emonhub_router as ehr
+
+
+class Sink(ehi.EmonHubInterfacer):
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.latency = []
+
+    def add(self, cargo):
+        self.latency.append(time.perf_counter() - cargo.rawdata)
+
+
+src = ehi.EmonHubInterfacer('src')
+src._settings['pubchannels'] = ['A']
+sink = Sink('sink')
+sink._settings['subchannels'] = ['A']
+router = ehr.EmonHubRouter()
+router.update({'src': src, 'sink': sink})
+router.start()
+src._router = router
+sink.start()
+
+for rate, n in ((1, 5), (100, 200), (10000, 20000)):
+    sink.latency.clear()
+    t0 = time.perf_counter()
+    for i in range(n):
+        target = t0 + i / rate
+        while time.perf_counter() < target:
+            if rate < 1000:
+                time.sleep(max(0, target - time.perf_counter()))
+        src.publish(Cargo.new_cargo(rawdata=time.perf_counter()))
+    time.sleep(0.5)
+    latency = sorted(sink.latency)
+    print("%5d frames/s: %d delivered, median %.2f ms, p99 %.2f ms"
+          % (rate, len(latency), statistics.median(latency) * 1e3, latency[int(len(latency) * 0.99) - 1] * 1e3))
+
+sink.stop = True
+router.stop = True
+router.notify()
@@ -0,0 +1,86 @@
+"""Batch decoding: _process_rx_batch against one frame at a time."""
+
+import copy
+import logging
+import random
+import statistics
+import time
+
+import common
+import Cargo
+import emonhub_coder as ehc
+import emonhub_interfacer as ehi
+
+logging.disable(logging.CRITICAL)
+
+nodes = {
+    '1': {'nodename': 'a', 'rx': {'names': ['MSG', 'p1', 'p2'], 'datacodes': ['L', 'h', 'h'], 'scales': ['1', '0.1', 1]}},
+    '2': {'nodename': 'b', 'rx': {'datacode': 'h', 'scale': '0.01'}},
+    '3': {'rx': {'datacode': 'h', 'scales': ['0.1', '1']}},
+    '4': {'rx': {'datacode': '0'}},
+    '5': {'rx': {'datacode': 'h', 'whitening': '1'}},
+    '7': {'rx': {'datacodes': ['h', 'h']}},
+}
+ehc.set_nodelist(copy.deepcopy(nodes))
+
+random.seed(2)
+frames = []
+for i in range(5000):
+    node = random.choice(['1', '1', '1', '2', '3', '4', '5', '7', '9'])
+    if node == '1':
+        data = [i % 256, 0, 0, 0] + [random.randrange(256) for _ in range(4)]
+    else:
+        data = [random.randrange(256) for _ in range(random.choice([4, 6, 8, 3]))]
+    if node == '4' or (node != '5' and random.random() < 0.03):
+        data = [str(x) for x in data]
+    if node != '5' and random.random() < 0.01:
+        data[0] = 300
+    frames.append((node, data))
+
+def interfacer():
+    I = ehi.EmonHubInterfacer('x')
+    I._settings['nodelistonly'] = False
+    I._settings['pubchannels'] = ['ToEmonCMS']
+    I._settings['channel_size'] = '100000'
+    return I
+
+def output(cargos):
+    return [(c.nodeid, c.nodename, list(c.names), list(c.realdata)) for c in cargos]
+
+I = interfacer()
+single = [c for c in (I._process_rx(Cargo.new_cargo(nodeid=int(n), realdata=list(d))) for n, d in frames) if c]
+batch = []
+for k in range(0, len(frames), 16):
+    batch += I._process_rx_batch([Cargo.new_cargo(nodeid=int(n), realdata=list(d)) for n, d in frames[k:k + 16]])
+assert output(single) == output(batch)
+print("single and batch decode the same %d frames" % len(single))
+
+# emonTx-like frames only, in batches of 16. Single and batch runs are
+# interleaved and repeated, and the median is reported, so that a slow
+# moment on the machine does not land on one side only.
+emontx = [d for n, d in frames if n == '1']
+
+def run(label):
+    I = interfacer()
+    rounds = [[Cargo.new_cargo(nodeid=1, realdata=list(d)) for d in emontx] for _ in range(5)]
+    t = time.perf_counter()
+    for cargos in rounds:
+        if label == 'single':
+            for c in cargos:
+                c = I._process_rx(c)
+                if c:
+                    I.publish(c)
+        else:
+            for k in range(0, len(cargos), 16):
+                I.publish_many(I._process_rx_batch(cargos[k:k + 16]))
+        for channel in I._pub_channels.values():
+            channel.get_all()
+    return (time.perf_counter() - t) / (len(rounds) * len(emontx)) * 1e6
+
+results = {'single': [], 'batch': []}
+for i in range(31):
+    for label in ('single', 'batch') if i % 2 else ('batch', 'single'):
+        results[label].append(run(label))
+for label, times in results.items():
+    print("%s: median %.2f us/frame (min %.2f, max %.2f, %d runs)"
+          % (label, statistics.median(times), min(times), max(times), len(times)))
@@ -0,0 +1,116 @@
+"""Segment log: SegmentBuffer against a deque model including crashes, and its cost."""
+
+import collections
+import logging
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+import common
+import emonhub_buffer as ehb
+from EmonHubEmoncmsHTTPInterfacer import EmonHubEmoncmsHTTPInterfacer
+from emoncms import Emoncms
+
+logging.disable(logging.CRITICAL)
+
+def frame(i):
+    r = random.random()
+    if r < 0.1:
+        return {'topic': 'x', 'payload': i}
+    if r < 0.2:
+        return [time.time(), 5, float('nan') if r < 0.12 else 0.1, 7]
+    if r < 0.3:
+        return [time.time(), 5, 2**60, 1]
+    return [1700000000.0 + i, random.randrange(30), random.randrange(-5000, 5000), random.randrange(100) / 4, 230.0]
+
+def same(a, b):
+    """Compare lists of frames, NaN equal to NaN."""
+    if len(a) != len(b):
+        return False
+    for x, y in zip(a, b):
+        if isinstance(x, list):
+            if len(x) != len(y) or any(not (u == v or (u != u and v != v)) for u, v in zip(x, y)):
+                return False
+        elif x != y:
+            return False
+    return True
+
+with tempfile.TemporaryDirectory() as path:
+    random.seed(5)
+    for capacity, segment_size in ((5, 200), (40, 500), (300, 4096)):
+        # Acks written on every discard, so nothing is sent again after a crash
+        def reopen():
+            return ehb.SegmentBuffer('model%d' % capacity, capacity, path=path,
+                                     segment_size=segment_size, ack_interval=0)
+        b = reopen()
+        model = collections.deque(maxlen=capacity)
+        for i in range(6000):
+            op = random.random()
+            if op < 0.5:
+                x = frame(i)
+                b.storeItem(x)
+                model.append(x)
+            elif op < 0.8:
+                k = random.randrange(0, capacity + 3)
+                assert same(b.retrieveItems(k), list(model)[:k])
+                if random.random() < 0.7:
+                    j = random.randrange(0, k + 1)
+                    b.discardLastRetrievedItems(j)
+                    for _ in range(min(j, len(model))):
+                        model.popleft()
+            elif op < 0.9:
+                k = random.randrange(0, capacity + 3)
+                b.discardLastRetrievedItems(k)
+                for _ in range(min(k, len(model))):
+                    model.popleft()
+            elif op < 0.95:
+                b.close()
+                b = reopen()
+            else:
+                # Crash: reopen without closing
+                b = reopen()
+            assert b.size() == len(model), (i, b.size(), len(model))
+        b.close()
+    print("segment buffer matches a deque, including reopening and crashes")
+
+    # Two weeks of frames every 10 s, stored during an outage then drained 1000 per flush
+    n = 14 * 8640
+    frame = [1700000000.0, 10] + [123.4] * 12
+    for label, create in (('memory', lambda: ehb.InMemoryBuffer('memory', 200000)),
+                          ('sqlite', lambda: ehb.SQLiteBuffer('sqlite', 200000, path=path)),
+                          ('segment', lambda: ehb.SegmentBuffer('segment', 200000, path=path))):
+        tracemalloc.start()
+        b = create()
+        t = time.perf_counter()
+        for i in range(n):
+            b.storeItem(list(frame))
+        dt = time.perf_counter() - t
+        ram = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        t = time.perf_counter()
+        while b.hasItems():
+            b.discardLastRetrievedItems(len(b.retrieveItems(1000)))
+        print("%-8s store %.1f us/frame, RAM %.1f MB, drain %.2f s"
+              % (label, dt / n * 1e6, ram / 1e6, time.perf_counter() - t))
+        b.close()
+
+    # A NaN reading is stored as JSON and kept across a crash, the emoncms
+    # sink drops it rather than failing its posts after every restart
+    b = ehb.SegmentBuffer('nan', 100, path=path)
+    for i in range(10):
+        b.storeItem([1700000000 + i, 10, float('nan') if i == 3 else i])
+    emoncms = Emoncms(latency=0)
+    I = EmonHubEmoncmsHTTPInterfacer('nan')
+    I.init_buffer(buffer_type='segment', buffer_path=path)
+    I.set(apikey='a' * 32, url=emoncms.url, interval='0')
+    t = time.time()
+    while (I.buffer.hasItems() or I._inflight) and time.time() - t < 10:
+        I.action()
+        time.sleep(0.01)
+    assert not I.buffer.hasItems() and emoncms.unique() == 9, emoncms.received
+    I._executor.shutdown()
+    I.buffer.close()
+    emoncms.close()
+    print("NaN frame discarded after a crash, the other %d sent" % emoncms.unique())
@@ -0,0 +1,79 @@
+"""Serial reactor: idle CPU, line latency and bursts on 6 pseudo-terminal ports, old against new."""
+
+import logging
+import os
+import pty
+import time
+import tty
+
+import common
+import EmonHubSerialInterfacer as new
+
+logging.basicConfig(level=logging.WARNING)
+
+old = common.load_module('src/interfacers/EmonHubSerialInterfacer.py', common.baseline())
+
+
+def device():
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    return master, slave, os.ttyname(slave)
+
+
+def bench(label, module, nports=6):
+    devices = [device() for _ in range(nports)]
+    timings = []
+    received = [0]
+    interfacers = []
+    for k, (master, slave, name) in enumerate(devices):
+        I = module.EmonHubSerialInterfacer('S%d' % k, name, 115200)
+        I._settings['pubchannels'] = ['x']
+        read = I.read
+        def timed_read(read=read, k=k):
+            cargos = read()
+            for c in (cargos if isinstance(cargos, list) else [cargos] if cargos else []):
+                received[0] += 1
+                if k == 0:
+                    timings.append(time.perf_counter() - float(c.realdata[0]))
+            return cargos
+        I.read = timed_read
+        I.start()
+        interfacers.append(I)
+    time.sleep(0.5)
+
+    # Idle CPU, all ports open and nothing arriving
+    t0 = time.process_time()
+    time.sleep(3)
+    idle = (time.process_time() - t0) / 3 * 100
+
+    # Latency, one line every 137 ms on port 0
+    for _ in range(40):
+        os.write(devices[0][0], b"10 %.9f 1 2\r\n" % time.perf_counter())
+        time.sleep(0.137)
+    time.sleep(0.3)
+    latency = sorted(timings)
+
+    # Burst, 200 lines written at once on each port
+    received[0] = 0
+    for master, slave, name in devices:
+        os.write(master, b"".join(b"10 %d 1 2\r\n" % i for i in range(200)))
+    t0 = time.perf_counter()
+    while received[0] < 200 * nports and time.perf_counter() - t0 < 3:
+        time.sleep(0.01)
+    burst = time.perf_counter() - t0
+
+    for I in interfacers:
+        I.stop = True
+    for I in interfacers:
+        I.join()
+        I.close()
+    for master, slave, name in devices:
+        os.close(master)
+        os.close(slave)
+    print("%s: idle CPU %.2f%%, latency median %.1f ms p95 %.1f ms, burst %d/%d lines in %.2f s"
+          % (label, idle, latency[len(latency) // 2] * 1e3, latency[int(len(latency) * .95)] * 1e3,
+             received[0], 200 * nports, burst))
+
+
+bench('old', old)
+bench('new', new)
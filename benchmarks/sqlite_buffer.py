@@ -0,0 +1,96 @@
+"""SQLite buffer: SQLiteBuffer against a deque model, and a two week backlog on disk."""
+
+import collections
+import logging
+import os
+import random
+import tempfile
+import time
+
+import common
+import emonhub_buffer as ehb
+from EmonHubEmoncmsHTTPInterfacer import EmonHubEmoncmsHTTPInterfacer
+from emoncms import Emoncms
+
+logging.disable(logging.CRITICAL)
+
+with tempfile.TemporaryDirectory() as path:
+    random.seed(4)
+    for capacity, commit_size in ((5, 1), (17, 3), (50, 100)):
+        name = 'model%d' % capacity
+        b = ehb.SQLiteBuffer(name, capacity, path=path, commit_interval=1e9, commit_size=commit_size)
+        model = collections.deque(maxlen=capacity)
+        for i in range(5000):
+            op = random.random()
+            if op < 0.5:
+                x = [i, random.random()]
+                b.storeItem(x)
+                model.append(x)
+            elif op < 0.8:
+                k = random.randrange(0, capacity + 3)
+                assert b.retrieveItems(k) == list(model)[:k]
+                if random.random() < 0.7:
+                    j = random.randrange(0, k + 1)
+                    b.discardLastRetrievedItems(j)
+                    for _ in range(min(j, len(model))):
+                        model.popleft()
+            elif op < 0.9:
+                k = random.randrange(0, capacity + 3)
+                b.discardLastRetrievedItems(k)
+                for _ in range(min(k, len(model))):
+                    model.popleft()
+            else:
+                b.close()
+                b = ehb.SQLiteBuffer(name, capacity, path=path, commit_interval=1e9, commit_size=commit_size)
+            assert b.size() == len(model), (b.size(), len(model))
+        b.close()
+    print("sqlite buffer matches a deque, including reopening")
+
+    # Two weeks of frames every 10 s, stored during an outage then drained 1000 per flush
+    n = 14 * 8640
+    frame = [1700000000.0, 10] + [123.4] * 12
+    b = ehb.SQLiteBuffer('outage', 200000, path=path)
+    t = time.perf_counter()
+    for i in range(n):
+        b.storeItem(frame)
+    b.commit()
+    dt = time.perf_counter() - t
+    size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path) if f.startswith('outage'))
+    print("store %d: %.1f us/frame, db %.1f MB" % (n, dt / n * 1e6, size / 1e6))
+    t = time.perf_counter()
+    flushes = 0
+    while b.hasItems():
+        b.discardLastRetrievedItems(len(b.retrieveItems(1000)))
+        flushes += 1
+    print("drain in %d flushes: %.2f s" % (flushes, time.perf_counter() - t))
+
+    # Full by item count, every store past the cap discards
+    b = ehb.SQLiteBuffer('full', 20000, path=path)
+    for i in range(20000):
+        b.storeItem(frame)
+    t = time.perf_counter()
+    for i in range(20000):
+        b.storeItem(frame)
+    b.commit()
+    print("store 20000 into a full buffer: %.1f us/frame, %d kept" % ((time.perf_counter() - t) / 20000 * 1e6, b.size()))
+    b.close()
+
+    # A NaN reading kept across restarts is dropped by the emoncms sink
+    # rather than failing its posts after every restart
+    b = ehb.SQLiteBuffer('nan', 100, path=path)
+    for i in range(10):
+        b.storeItem([1700000000 + i, 10, float('nan') if i == 3 else i])
+    b.close()
+    emoncms = Emoncms(latency=0)
+    I = EmonHubEmoncmsHTTPInterfacer('nan')
+    I.init_buffer(buffer_type='sqlite', buffer_path=path)
+    I.set(apikey='a' * 32, url=emoncms.url, interval='0')
+    t = time.time()
+    while (I.buffer.hasItems() or I._inflight) and time.time() - t < 10:
+        I.action()
+        time.sleep(0.01)
+    assert not I.buffer.hasItems() and emoncms.unique() == 9, emoncms.received
+    I._executor.shutdown()
+    I.buffer.close()
+    emoncms.close()
+    print("NaN frame discarded after a restart, the other %d sent" % emoncms.unique())
@@ -196,6 +196,13 @@ if [ -f /var/log/emonhub/emonhub.log ]; then
     sudo chmod 644 /var/log/emonhub/emonhub.log
 fi
 
+# Persistent buffer directory (buffer_type = sqlite)
+if [ ! -d /var/lib/emonhub ]; then
+    echo "Creating /var/lib/emonhub directory"
+    sudo mkdir /var/lib/emonhub
+fi
+sudo chown $user:root /var/lib/emonhub
+
 
 # ---------------------------------------------------------
 # Symlink emonhub source to /usr/local/bin/emonhub
@@ -1,12 +1,22 @@
 import time
+import types
+import itertools
+
+# Cargo ids, next() on a count is atomic so interfacer threads can share it
+_uri = itertools.count(1)
+
+# Shared by all cargo until a sink attaches its own encoded data
+_no_encoded = types.MappingProxyType({})
 
 class EmonHubCargo:
-    uri = 0
+    # Fixed attributes, no per-cargo __dict__
+    __slots__ = ('uri', 'timestamp', 'target', 'nodeid', 'nodename', 'names', 'realdata',
+                 'rssi', 'rawdata', 'encoded', 'units', 'realdatacodes', 'frozen')
 
     # The class "constructor" - It's actually an initializer
     def __init__(self, timestamp, target, nodeid, nodename, names, realdata, rssi, rawdata):
-        EmonHubCargo.uri += 1
-        self.uri = EmonHubCargo.uri
+        self.frozen = False
+        self.uri = next(_uri)
         self.timestamp = float(timestamp)
         self.target = int(target)
         self.nodeid = int(nodeid)
@@ -14,14 +24,57 @@ class EmonHubCargo:
         self.names = names
         self.realdata = realdata
         self.rssi = int(rssi)
-
-        # self.datacodes = []
-        # self.datacode = ""
-        # self.scale = 0
-        # self.scales = []
         self.rawdata = rawdata
-        self.encoded = {}
-        # self.realdatacodes = []
+        self.encoded = _no_encoded
+
+        # Optional extras set by some sources
+        self.units = None
+        self.realdatacodes = None
+
+    def freeze(self):
+        """Make the cargo read-only before it is shared between interfacers.
+
+        names and realdata become tuples and encoded a read-only mapping, so
+        one decoded frame can be handed to any number of sinks without
+        copying and without one sink's changes reaching another.
+
+        """
+        if not self.frozen:
+            self.names = tuple(self.names)
+            self.realdata = tuple(self.realdata)
+            if type(self.encoded) is not types.MappingProxyType:
+                self.encoded = types.MappingProxyType(self.encoded)
+            self.frozen = True
+            # Only frozen cargo pays for the check on setting attributes
+            self.__class__ = _FrozenEmonHubCargo
+        return self
+
+    def overlay(self, **fields):
+        """Return a view of the cargo with some fields replaced.
+
+        The rest of the payload is shared rather than copied, e.g. a sink
+        attaches its encoded data with overlay(encoded={name: data}).
+
+        """
+        view = object.__new__(type(self))
+        for name in EmonHubCargo.__slots__:
+            object.__setattr__(view, name, getattr(self, name))
+        for name, value in fields.items():
+            object.__setattr__(view, name, value)
+        return view
+
+
+class _FrozenEmonHubCargo(EmonHubCargo):
+    # Same layout, so freeze() can switch an EmonHubCargo to this class
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        raise AttributeError("cargo %d is frozen, use overlay() to change %s" % (self.uri, name))
 
-def new_cargo(rawdata="", nodename=False, names=[], realdata=[], nodeid=0, timestamp=0.0, target=0, rssi=0.0):
+def new_cargo(rawdata="", nodename=False, names=None, realdata=None, nodeid=0, timestamp=0.0, target=0, rssi=0.0):
+    # names and realdata default to new lists, sources append to them
+    if names is None:
+        names = []
+    if realdata is None:
+        realdata = []
     return EmonHubCargo(timestamp or time.time(), target, nodeid, nodename, names, realdata, rssi, rawdata)
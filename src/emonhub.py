@@ -26,6 +26,7 @@ import emonhub_setup as ehs
 import emonhub_coder as ehc
 import emonhub_interfacer as ehi
 import emonhub_auto_conf as eha
+import emonhub_router as ehr
 from interfacers import *
 
 # this namespace and path
@@ -81,6 +82,10 @@ class EmonHub:
         # Initialize Interfacers
         self._interfacers = {}
 
+        # Initialize router, delivers cargo between interfacers as it is published
+        self._router = ehr.EmonHubRouter()
+        self._router.start()
+
         # Update settings
         self._update_settings(settings)
         
@@ -122,29 +127,13 @@ class EmonHub:
                 self._setup.settings['nodes'] = ehc.nodelist
                 self._setup.settings.write()
 
-            # For all Interfacers
+            # For all Interfacers (cargo is delivered by the router)
             kill_list = []
             for I in self._interfacers.values():
                 # Check threads are still running
                 if not I.is_alive():
                     kill_list.append(I.name) # <-avoid modification of iterable within loop
 
-                # Read each interfacers pub channels
-                for pub_channel in I._settings['pubchannels']:
-
-                    if pub_channel in I._pub_channels and len(I._pub_channels[pub_channel]) > 0:
-                        # POP cargo item (one at a time)
-                        cargo = I._pub_channels[pub_channel].pop(0)
-
-                        # Post to each subscriber interface
-                        for sub_interfacer in self._interfacers.values():
-                            # For each subscriber channel
-                            for sub_channel in sub_interfacer._settings['subchannels']:
-                                # If channel names match
-                                if sub_channel == pub_channel:
-                                    # APPEND cargo item
-                                    sub_interfacer._sub_channels.setdefault(sub_channel, []).append(cargo)
-
             # ->avoid modification of iterable within loop
             for name in kill_list:
                 self._log.warning("%s thread is dead.", name)
@@ -170,6 +159,10 @@ class EmonHub:
             I.stop = True
             I.join()
 
+        self._router.stop = True
+        self._router.notify()
+        self._router.join()
+
         self._log.info("Exit completed")
 
     def _signal_handler(self, signal, frame):
@@ -223,7 +216,10 @@ class EmonHub:
             interfacers_to_delete.append(name)
 
         for name in interfacers_to_delete:
-            del self._interfacers[name]
+            # Wait for it to close its port and buffer, a replacement may open the same ones
+            I = self._interfacers.pop(name)
+            if I.is_alive():
+                I.join()
 
         for name, I in settings['interfacers'].items():
             # If interfacer does not exist, create it
@@ -233,9 +229,21 @@ class EmonHub:
                         continue
                     self._log.info("Creating %s '%s'", I['Type'], name)
                     # This gets the class from the 'Type' string
-                    interfacer = getattr(ehi, I['Type'])(name, **I['init_settings'])
-                    interfacer.set(**I['runtimesettings'])
+                    # buffer_* settings choose the interfacer's buffer rather than configure its source
+                    init_settings = dict(I['init_settings'])
+                    buffer_settings = {key: init_settings.pop(key) for key in list(init_settings)
+                                       if key.startswith('buffer_')}
+                    interfacer = getattr(ehi, I['Type'])(name, **init_settings)
+                    try:
+                        interfacer.init_buffer(**buffer_settings)
+                        interfacer.set(**I['runtimesettings'])
+                    except Exception:
+                        # It will never run, release what __init__ opened
+                        interfacer.close()
+                        interfacer.buffer.close()
+                        raise
                     interfacer.init_settings = I['init_settings']
+                    interfacer._router = self._router
                     interfacer.start()
                 except ehi.EmonHubInterfacerInitError as e:
                     # If interfacer can't be created, log error and skip to next
@@ -252,8 +260,11 @@ class EmonHub:
                 if 'runtimesettings' in I:
                     self._interfacers[name].set(**I['runtimesettings'])
 
+        # Rebuild the routing table for the created, deleted or updated interfacers
+        self._router.update(self._interfacers)
+
         if 'nodes' in settings:
-            ehc.nodelist = settings['nodes']
+            ehc.set_nodelist(settings['nodes'])
 
     def _set_logging_level(self, level='WARNING', log=True):
         """Set logging level.
@@ -7,7 +7,32 @@
 
 """
 
+import json
 import logging
+import mmap
+import os
+import sqlite3
+import struct
+import sys
+import time
+import zlib
+from array import array
+
+def estimateItemBytes(item):
+    """Approximate the memory held by a buffered item, in bytes.
+
+    Counts the item and the values it holds, so that a frame of 40 values
+    weighs about ten times one of 3.
+
+    """
+    size = sys.getsizeof(item)
+    if isinstance(item, (list, tuple)):
+        size += sum(map(sys.getsizeof, item))
+    elif isinstance(item, dict):
+        for key, value in item.items():
+            size += sys.getsizeof(key) + sys.getsizeof(value)
+    return size
+
 
 """class AbstractBuffer
 
@@ -20,7 +45,7 @@ class AbstractBuffer:
     def storeItem(self, data):
         raise NotImplementedError
 
-    def retrieveItems(self, number):
+    def retrieveItems(self, number, offset=0):
         raise NotImplementedError
 
     def retrieveItem(self):
@@ -35,65 +60,809 @@ class AbstractBuffer:
     def hasItems(self):
         raise NotImplementedError
 
+    def fillLevel(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
 """
 This implementation of the AbstractBuffer just uses an in-memory data structure.
-It's basically identical to the previous (inline) buffer.
+
+Items are held in a preallocated ring of slots: storing is O(1), retrieving
+k items is O(k) and discarding k items only clears their slots, so draining
+a large backlog no longer copies the remainder of the buffer on every flush.
+When full, the oldest item is overwritten.
 """
 
 
 class InMemoryBuffer(AbstractBuffer):
 
-    def __init__(self, bufferName, buffer_size):
+    def __init__(self, bufferName, buffer_size, max_bytes=0):
         self._bufferName = str(bufferName)
         self._buffer_type = "memory"
         self._maximumEntriesInBuffer = int(buffer_size)
-        self._data_buffer = []
+        self._maximumBytesInBuffer = int(max_bytes)
+        self._data_buffer = [None] * self._maximumEntriesInBuffer
+        # estimated size of each item, only kept if max_bytes is set
+        self._item_bytes = array('I', bytes(4 * self._maximumEntriesInBuffer)) if self._maximumBytesInBuffer else None
+        self._bytes = 0
+        # index of the oldest item and number of items held
+        self._head = 0
+        self._count = 0
         self._log = logging.getLogger("EmonHub")
 
     def hasItems(self):
-        return self.size() > 0
+        return self._count > 0
 
     def isFull(self):
-        return self.size() >= self._maximumEntriesInBuffer
+        return self._count >= self._maximumEntriesInBuffer
 
-    def getMaxEntrySliceIndex(self):
-        return max(0,
-                   self.size() - self._maximumEntriesInBuffer - 1)
+    def fillLevel(self):
+        level = self._count / self._maximumEntriesInBuffer
+        if self._maximumBytesInBuffer:
+            level = max(level, self._bytes / self._maximumBytesInBuffer)
+        return level
 
-    def discardOldestItems(self):
-        self._data_buffer = self._data_buffer[self.getMaxEntrySliceIndex():]
+    def discardOldestItems(self, number=1):
+        self.discardLastRetrievedItems(number)
 
-    def discardOldestItemsIfFull(self):
+    def discardOldestItemsIfFull(self, nbytes=0):
         if self.isFull():
             self._log.warning(
                 "In-memory buffer (%s) reached limit of %d items, deleting oldest",
                 self._bufferName, self._maximumEntriesInBuffer)
-        self.discardOldestItems()
+            self.discardOldestItems()
+        if self._maximumBytesInBuffer and self._count and self._bytes + nbytes > self._maximumBytesInBuffer:
+            self._log.warning(
+                "In-memory buffer (%s) reached limit of %d bytes, deleting oldest",
+                self._bufferName, self._maximumBytesInBuffer)
+            while self._count and self._bytes + nbytes > self._maximumBytesInBuffer:
+                self.discardOldestItems()
+
+    def storeItem(self, data):
+        nbytes = estimateItemBytes(data) if self._maximumBytesInBuffer else 0
+        self.discardOldestItemsIfFull(nbytes)
+        tail = (self._head + self._count) % self._maximumEntriesInBuffer
+        self._data_buffer[tail] = data
+        if nbytes:
+            self._item_bytes[tail] = nbytes
+            self._bytes += nbytes
+        self._count += 1
+
+    def retrieveItem(self):
+        if not self._count:
+            raise IndexError("buffer is empty")
+        return self._data_buffer[self._head]
+
+    def retrieveItems(self, number, offset=0):
+        number = min(number, self._count - offset)
+        if number <= 0:
+            return []
+        start = (self._head + offset) % self._maximumEntriesInBuffer
+        end = start + number
+        if end <= self._maximumEntriesInBuffer:
+            return self._data_buffer[start:end]
+        # wraps around the end of the ring
+        return self._data_buffer[start:] + self._data_buffer[:end - self._maximumEntriesInBuffer]
+
+    def discardLastRetrievedItem(self):
+        self.discardLastRetrievedItems(1)
+
+    def discardLastRetrievedItems(self, number):
+        number = min(number, self._count)
+        start = self._head
+        end = start + number
+        # clear the slots so the items can be freed
+        if end <= self._maximumEntriesInBuffer:
+            self._data_buffer[start:end] = [None] * number
+            if self._item_bytes:
+                self._bytes -= sum(self._item_bytes[start:end])
+        else:
+            end -= self._maximumEntriesInBuffer
+            self._data_buffer[start:] = [None] * (self._maximumEntriesInBuffer - start)
+            self._data_buffer[:end] = [None] * end
+            if self._item_bytes:
+                self._bytes -= sum(self._item_bytes[start:]) + sum(self._item_bytes[:end])
+        self._head = end % self._maximumEntriesInBuffer if self._maximumEntriesInBuffer else 0
+        self._count -= number
+
+    def size(self):
+        return self._count
+
+
+"""
+This implementation of the AbstractBuffer holds items in memory in compressed
+columnar blocks, so that a long outage takes a fraction of the memory of
+the lists held by InMemoryBuffer.
+
+Frames in emonCMS format ([timestamp, nodeid, values...]) are split into
+columns: timestamps as int64 microsecond deltas, a layout id per frame for
+its node and number of values, and the values in a float32 column, or a
+float64 column when float32 would lose precision. Other items are kept as
+JSON. Once a block holds block_size frames it is sealed and compressed with
+zlib, blocks are only decompressed when retrieved for sending. Decoded
+values are floats and timestamps are rounded to the microsecond.
+"""
+
+_COLUMNS_HEADER = struct.Struct('<IIIII')
+_OPAQUE_LAYOUT = 0xFFFF
+
+
+class _ColumnBlock:
+    """Columns of a block of frames, compressed once sealed"""
+
+    def __init__(self, first_time=0):
+        self.count = 0
+        # Timestamp the first delta is from, in microseconds
+        self.first_time = first_time
+        self.times = array('q')
+        self.layouts = array('H')
+        self.values32 = array('f')
+        self.values64 = array('d')
+        self.opaque = []
+        # Set once sealed, the columns are then dropped
+        self.compressed = None
+        # Decoded frames, kept while the block is being sent
+        self.frames = None
+
+    def nbytes(self):
+        # Read by the router through backpressure() while the interfacer
+        # may be sealing the block: seal() sets compressed before it drops
+        # the columns, so a dropped column means compressed is set
+        times, layouts, values32, values64, opaque = \
+            self.times, self.layouts, self.values32, self.values64, self.opaque
+        if self.compressed is not None or None in (times, layouts, values32, values64, opaque):
+            return len(self.compressed)
+        return (times.itemsize * len(times) + layouts.itemsize * len(layouts)
+                + values32.itemsize * len(values32) + values64.itemsize * len(values64)
+                + sum(map(len, opaque)))
+
+    def seal(self):
+        opaque = json.dumps(self.opaque).encode()
+        self.compressed = zlib.compress(b''.join((
+            _COLUMNS_HEADER.pack(len(self.times), len(self.layouts), len(self.values32),
+                                 len(self.values64), len(opaque)),
+            self.times.tobytes(), self.layouts.tobytes(),
+            self.values32.tobytes(), self.values64.tobytes(), opaque)))
+        self.times = self.layouts = self.values32 = self.values64 = self.opaque = None
+
+    def columns(self):
+        """Return the columns, decompressing a sealed block"""
+        if self.compressed is None:
+            return self.times, self.layouts, self.values32, self.values64, self.opaque
+        data = zlib.decompress(self.compressed)
+        lengths = _COLUMNS_HEADER.unpack_from(data)
+        pos = _COLUMNS_HEADER.size
+        columns = []
+        for typecode, length in zip('qHfd', lengths):
+            column = array(typecode)
+            column.frombytes(data[pos:pos + length * column.itemsize])
+            pos += length * column.itemsize
+            columns.append(column)
+        columns.append(json.loads(data[pos:pos + lengths[4]]))
+        return columns
+
+
+class CompressedBuffer(AbstractBuffer):
+
+    def __init__(self, bufferName, buffer_size, max_bytes=0, block_size=500):
+        self._bufferName = str(bufferName)
+        self._buffer_type = "compressed"
+        self._maximumEntriesInBuffer = int(buffer_size)
+        self._maximumBytesInBuffer = int(max_bytes)
+        self._block_size = int(block_size)
+        self._log = logging.getLogger("EmonHub")
+
+        # (nodeid, number of values, typecode) by layout id and the reverse
+        self._layouts = []
+        self._layout_ids = {}
+
+        # Blocks oldest first, the last one is open for storing
+        self._blocks = [_ColumnBlock()]
+        # Timestamp in microseconds of the last frame stored, for the deltas
+        self._last_time = 0
+        # Index in the oldest block of the first item not discarded
+        self._read_index = 0
+        self._count = 0
+        # Size of the sealed blocks
+        self._sealed_bytes = 0
+
+    def hasItems(self):
+        return self._count > 0
+
+    def isFull(self):
+        return self._count >= self._maximumEntriesInBuffer
+
+    def fillLevel(self):
+        level = self._count / self._maximumEntriesInBuffer
+        if self._maximumBytesInBuffer:
+            level = max(level, self.bytes() / self._maximumBytesInBuffer)
+        return level
+
+    def bytes(self):
+        """Memory held by the blocks, compressed or not, in bytes."""
+        return self._sealed_bytes + self._blocks[-1].nbytes()
+
+    def discardOldestItemsIfFull(self):
+        if self.isFull():
+            self._log.warning(
+                "Compressed buffer (%s) reached limit of %d items, deleting oldest",
+                self._bufferName, self._maximumEntriesInBuffer)
+            self.discardLastRetrievedItems(self._count - self._maximumEntriesInBuffer + 1)
+        if self._maximumBytesInBuffer and len(self._blocks) > 1 and self.bytes() > self._maximumBytesInBuffer:
+            self._log.warning(
+                "Compressed buffer (%s) reached limit of %d bytes, deleting oldest block",
+                self._bufferName, self._maximumBytesInBuffer)
+            while len(self._blocks) > 1 and self.bytes() > self._maximumBytesInBuffer:
+                self.discardLastRetrievedItems(self._blocks[0].count - self._read_index)
+
+    def _layout_id(self, key):
+        layout_id = self._layout_ids.get(key)
+        if layout_id is None:
+            if len(self._layouts) >= _OPAQUE_LAYOUT:
+                return _OPAQUE_LAYOUT
+            layout_id = self._layout_ids[key] = len(self._layouts)
+            self._layouts.append(key)
+        return layout_id
 
     def storeItem(self, data):
         self.discardOldestItemsIfFull()
-        self._data_buffer.append(data)
+        block = self._blocks[-1]
+
+        layout_id = _OPAQUE_LAYOUT
+        if type(data) is list and len(data) >= 2 and type(data[1]) is int \
+                and type(data[0]) in (int, float):
+            values = data[2:]
+            try:
+                packed = array('f', values)
+                typecode = 'f' if packed.tolist() == values else 'd'
+                if typecode == 'd':
+                    packed = array('d', values)
+                    if packed.tolist() != values:
+                        raise ValueError
+                timestamp = round(data[0] * 1000000)
+            except (TypeError, ValueError, OverflowError):
+                pass
+            else:
+                layout_id = self._layout_id((data[1], len(values), typecode))
+
+        if layout_id == _OPAQUE_LAYOUT:
+            block.times.append(0)
+            block.opaque.append(json.dumps(data))
+        else:
+            block.times.append(timestamp - self._last_time)
+            self._last_time = timestamp
+            if typecode == 'f':
+                block.values32.extend(packed)
+            else:
+                block.values64.extend(packed)
+        block.layouts.append(layout_id)
+        block.count += 1
+        self._count += 1
+
+        if block.count >= self._block_size:
+            block.seal()
+            self._sealed_bytes += block.nbytes()
+            self._blocks.append(_ColumnBlock(self._last_time))
+
+    def _decode(self, block):
+        """Return the frames of a block, kept for sealed blocks until discarded"""
+        if block.frames is not None:
+            return block.frames
+        times, layouts, values32, values64, opaque = block.columns()
+        layout_keys = self._layouts
+        # Timestamps are deltas from the last frame of the previous block
+        timestamp = block.first_time
+        frames = []
+        pos32 = pos64 = index = 0
+        for delta, layout_id in zip(times, layouts):
+            if layout_id == _OPAQUE_LAYOUT:
+                frames.append(json.loads(opaque[index]))
+                index += 1
+                continue
+            timestamp += delta
+            node, count, typecode = layout_keys[layout_id]
+            frame = [timestamp / 1000000, node]
+            if typecode == 'f':
+                frame.extend(values32[pos32:pos32 + count])
+                pos32 += count
+            else:
+                frame.extend(values64[pos64:pos64 + count])
+                pos64 += count
+            frames.append(frame)
+        if block.compressed is not None:
+            block.frames = frames
+        return frames
+
+    def retrieveItem(self):
+        return self.retrieveItems(1)[0]
+
+    def retrieveItems(self, number, offset=0):
+        items = []
+        start = self._read_index + offset
+        for block in self._blocks:
+            if len(items) >= number:
+                break
+            if start >= block.count:
+                # skipped without decompressing
+                start -= block.count
+                continue
+            items.extend(self._decode(block)[start:start + number - len(items)])
+            start = 0
+        return items
+
+    def discardLastRetrievedItem(self):
+        self.discardLastRetrievedItems(1)
+
+    def discardLastRetrievedItems(self, number):
+        number = min(number, self._count)
+        self._count -= number
+        self._read_index += number
+        # Drop the blocks sent to the end, bar the open one
+        while len(self._blocks) > 1 and self._read_index >= self._blocks[0].count:
+            self._read_index -= self._blocks[0].count
+            self._sealed_bytes -= self._blocks.pop(0).nbytes()
+        if not self._count and self._blocks[0].count:
+            # Everything sent, start a new open block
+            self._blocks = [_ColumnBlock(self._last_time)]
+            self._read_index = 0
+
+    def size(self):
+        return self._count
+
+
+"""
+This implementation of the AbstractBuffer keeps items in an SQLite database
+so they survive a restart or power cut.
+
+New items are held in memory and inserted in one transaction every
+commit_interval seconds or commit_size items, and the database runs in WAL
+mode with synchronous=NORMAL, so a week long outage at 10 second intervals
+costs a few writes a minute rather than an fsync per item. Up to
+commit_interval seconds of items can be lost on a power cut.
+
+Items are retrieved oldest first with one range query over the primary key
+and discarded by deleting everything up to the last retrieved id.
+"""
+
+
+class SQLiteBuffer(AbstractBuffer):
+
+    def __init__(self, bufferName, buffer_size, max_bytes=0, path="/var/lib/emonhub", commit_interval=60, commit_size=100):
+        self._bufferName = str(bufferName)
+        self._buffer_type = "sqlite"
+        self._maximumEntriesInBuffer = int(buffer_size)
+        self._maximumBytesInBuffer = int(max_bytes)
+        self._commit_interval = float(commit_interval)
+        self._commit_size = int(commit_size)
+        self._log = logging.getLogger("EmonHub")
+
+        os.makedirs(path, exist_ok=True)
+        self._filename = os.path.join(path, self._bufferName + ".sqlite")
+
+        # Created by the hub, then used by the interfacer thread
+        self._db = sqlite3.connect(self._filename, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS buffer (id INTEGER PRIMARY KEY, frame TEXT NOT NULL)")
+        self._db.commit()
+
+        # Number of rows in the database, items not yet inserted are in _pending
+        self._db_count, self._db_bytes = self._db.execute(
+            "SELECT COUNT(*), TOTAL(LENGTH(frame)) FROM buffer").fetchone()
+        self._db_bytes = int(self._db_bytes)
+        # Items not yet inserted, with their JSON text
+        self._pending = []
+        self._pending_json = []
+        self._pending_bytes = 0
+        self._last_commit = time.time()
+
+        # Ids of the rows returned by the last retrieveItems()
+        self._retrieved_ids = []
+
+        if self._db_count:
+            self._log.info("SQLite buffer (%s) restored %d items from %s",
+                           self._bufferName, self._db_count, self._filename)
+
+    def hasItems(self):
+        return self.size() > 0
+
+    def isFull(self):
+        return self.size() >= self._maximumEntriesInBuffer
+
+    def fillLevel(self):
+        level = self.size() / self._maximumEntriesInBuffer
+        if self._maximumBytesInBuffer:
+            level = max(level, self.bytes() / self._maximumBytesInBuffer)
+        return level
+
+    def bytes(self):
+        """Size of the buffered items as stored, in bytes."""
+        return self._db_bytes + self._pending_bytes
+
+    def discardOldestItemsIfFull(self, nbytes=0):
+        if self.isFull():
+            self._log.warning(
+                "SQLite buffer (%s) reached limit of %d items, deleting oldest",
+                self._bufferName, self._maximumEntriesInBuffer)
+            self._retrieved_ids = []
+            # Delete 1% at a time rather than a row per item stored, each
+            # delete is a write transaction
+            self.discardLastRetrievedItems(max(self.size() - self._maximumEntriesInBuffer + 1,
+                                               self._maximumEntriesInBuffer // 100))
+        if self._maximumBytesInBuffer and self.size() and self.bytes() + nbytes > self._maximumBytesInBuffer:
+            self._log.warning(
+                "SQLite buffer (%s) reached limit of %d bytes, deleting oldest",
+                self._bufferName, self._maximumBytesInBuffer)
+            self._retrieved_ids = []
+            # Delete 1% at a time rather than a row per item stored
+            while self.size() and self.bytes() + nbytes > self._maximumBytesInBuffer:
+                self.discardLastRetrievedItems(max(1, self.size() // 100))
+
+    def storeItem(self, data):
+        frame = json.dumps(data)
+        self.discardOldestItemsIfFull(len(frame))
+        self._pending.append(data)
+        self._pending_json.append(frame)
+        self._pending_bytes += len(frame)
+        if len(self._pending) >= self._commit_size \
+                or time.time() - self._last_commit >= self._commit_interval:
+            self.commit()
+
+    def commit(self):
+        """Insert the pending items in one transaction."""
+        self._last_commit = time.time()
+        if not self._pending:
+            return
+        try:
+            with self._db:
+                self._db.executemany("INSERT INTO buffer (frame) VALUES (?)",
+                                     [(frame,) for frame in self._pending_json])
+        except sqlite3.Error as e:
+            # Keep the items in memory and try again at the next commit
+            self._log.error("SQLite buffer (%s) insert failed: %s", self._bufferName, e)
+            return
+        self._db_count += len(self._pending)
+        self._db_bytes += self._pending_bytes
+        self._pending = []
+        self._pending_json = []
+        self._pending_bytes = 0
 
     def retrieveItem(self):
-        return self._data_buffer[0]
+        return self.retrieveItems(1)[0]
+
+    def retrieveItems(self, number, offset=0):
+        items = []
+        self._retrieved_ids = []
+        if offset < self._db_count and number > 0:
+            rows = self._db.execute("SELECT id, frame FROM buffer ORDER BY id LIMIT ? OFFSET ?",
+                                    (number, offset)).fetchall()
+            # Only the oldest items can be discarded by high-water mark
+            if not offset:
+                self._retrieved_ids = [row[0] for row in rows]
+            items = [json.loads(row[1]) for row in rows]
+        if len(items) < number:
+            start = max(0, offset - self._db_count)
+            items += self._pending[start:start + number - len(items)]
+        return items
+
+    def discardLastRetrievedItem(self):
+        self.discardLastRetrievedItems(1)
+
+    def discardLastRetrievedItems(self, number):
+        number = min(number, self.size())
+        from_db = min(number, self._db_count)
+        if from_db:
+            if len(self._retrieved_ids) >= from_db:
+                high_water = self._retrieved_ids[from_db - 1]
+            else:
+                high_water = self._db.execute("SELECT id FROM buffer ORDER BY id LIMIT 1 OFFSET ?",
+                                              (from_db - 1,)).fetchone()[0]
+            with self._db:
+                deleted, deleted_bytes = self._db.execute(
+                    "SELECT COUNT(*), TOTAL(LENGTH(frame)) FROM buffer WHERE id <= ?", (high_water,)).fetchone()
+                self._db.execute("DELETE FROM buffer WHERE id <= ?", (high_water,))
+            self._db_count = max(0, self._db_count - deleted)
+            self._db_bytes = max(0, self._db_bytes - int(deleted_bytes))
+        self._retrieved_ids = []
+        from_pending = number - from_db
+        if from_pending > 0:
+            self._pending_bytes -= sum(map(len, self._pending_json[:from_pending]))
+            del self._pending[:from_pending]
+            del self._pending_json[:from_pending]
+
+    def size(self):
+        return self._db_count + len(self._pending)
+
+    def close(self):
+        self.commit()
+        self._db.close()
+
+
+"""
+This implementation of the AbstractBuffer appends items to fixed size
+memory-mapped segment files, for very long outages with little RAM.
+
+Each record is a header (kind, crc32, payload length) and a payload. Frames
+in emonCMS format ([timestamp, nodeid, values...]) are packed as a float64
+timestamp, a uint32 node and float32 values, or float64 values when float32
+would lose precision; anything else is stored as JSON. Decoded values are
+floats. Records are unpacked straight out of the mapping, the only per item
+memory is a 4 byte offset.
+
+The first unacknowledged record is kept in an ack file, written at most
+every ack_interval seconds and whenever a segment is deleted, so up to
+ack_interval seconds of records sent before a power cut are sent again.
+Segments are deleted whole once every record in them has been discarded. On start the
+segments are scanned and the log resumes after the last intact record.
+Written records reach the disk with the kernel's normal writeback.
+"""
+
+_SEGMENT_HEADER = struct.Struct('<BII')
+_SEGMENT_FRAME = struct.Struct('<dI')
+_SEGMENT_FLOAT32, _SEGMENT_FLOAT64, _SEGMENT_JSON = 1, 2, 3
+
+
+class _Segment:
+    """One memory-mapped segment file and the offsets of its records"""
+
+    def __init__(self, filename, seq, size):
+        self.filename = filename
+        self.seq = seq
+        with open(filename, 'a+b') as f:
+            if os.fstat(f.fileno()).st_size < size:
+                f.truncate(size)
+            self.mm = mmap.mmap(f.fileno(), size)
+        self.size = size
+        self.offsets = array('I')
+        self.write_pos = 0
+
+    def scan(self):
+        """Find the intact records of an existing segment"""
+        mm = self.mm
+        pos = 0
+        while pos + _SEGMENT_HEADER.size <= self.size:
+            kind, crc, length = _SEGMENT_HEADER.unpack_from(mm, pos)
+            end = pos + _SEGMENT_HEADER.size + length
+            if not kind or end > self.size or zlib.crc32(mm[pos + _SEGMENT_HEADER.size:end]) != crc:
+                break
+            self.offsets.append(pos)
+            pos = end
+        self.write_pos = pos
+        # Clear anything torn after the last intact record, a torn write
+        # may have left its payload with the header still zero
+        if mm[pos:self.size].count(0) < self.size - pos:
+            mm[pos:self.size] = bytes(self.size - pos)
+
+    def append(self, kind, payload):
+        """Append a record, return False if the segment is full"""
+        end = self.write_pos + _SEGMENT_HEADER.size + len(payload)
+        if end > self.size:
+            return False
+        pos = self.write_pos
+        # Payload first, the header makes the record valid
+        self.mm[pos + _SEGMENT_HEADER.size:end] = payload
+        self.mm[pos:pos + _SEGMENT_HEADER.size] = _SEGMENT_HEADER.pack(kind, zlib.crc32(payload), len(payload))
+        self.offsets.append(pos)
+        self.write_pos = end
+        return True
+
+    def read(self, index):
+        mm = self.mm
+        pos = self.offsets[index]
+        kind, crc, length = _SEGMENT_HEADER.unpack_from(mm, pos)
+        pos += _SEGMENT_HEADER.size
+        if kind == _SEGMENT_JSON:
+            return json.loads(mm[pos:pos + length])
+        timestamp, node = _SEGMENT_FRAME.unpack_from(mm, pos)
+        values = _SEGMENT_FRAME.size
+        if kind == _SEGMENT_FLOAT32:
+            count = (length - values) // 4
+            code = 'f'
+        else:
+            count = (length - values) // 8
+            code = 'd'
+        frame = [timestamp, node]
+        frame.extend(struct.unpack_from('<%d%s' % (count, code), mm, pos + values))
+        return frame
+
+    def close(self, delete=False):
+        self.mm.close()
+        if delete:
+            os.remove(self.filename)
+
+
+class SegmentBuffer(AbstractBuffer):
+
+    def __init__(self, bufferName, buffer_size, max_bytes=0, path="/var/lib/emonhub", segment_size=1048576,
+                 ack_interval=60):
+        self._bufferName = str(bufferName)
+        self._buffer_type = "segment"
+        self._maximumEntriesInBuffer = int(buffer_size)
+        self._maximumBytesInBuffer = int(max_bytes)
+        self._segment_size = int(segment_size)
+        self._ack_interval = float(ack_interval)
+        if self._maximumBytesInBuffer and self._maximumBytesInBuffer < self._segment_size:
+            raise ValueError("max_bytes must be at least segment_size (%d)" % self._segment_size)
+        self._log = logging.getLogger("EmonHub")
+
+        self._path = os.path.join(path, self._bufferName)
+        os.makedirs(self._path, exist_ok=True)
+        self._ack_filename = os.path.join(self._path, "ack")
+
+        # Segments oldest first, the last one is written to
+        self._segments = []
+        # Index in the oldest segment of the first unacknowledged record
+        self._read_index = 0
+        self._count = 0
+        # Sequence number of the next segment file, never reused
+        self._next_seq = 1
+        self._last_ack = time.time()
+        self._recover()
+
+    def _recover(self):
+        ack_seq, ack_index = 0, 0
+        try:
+            with open(self._ack_filename) as f:
+                ack_seq, ack_index = (int(x) for x in f.read().split())
+        except (OSError, ValueError):
+            pass
+
+        for name in sorted(os.listdir(self._path)):
+            if not name.endswith(".seg"):
+                continue
+            segment = _Segment(os.path.join(self._path, name), int(name[:-4]), self._segment_size)
+            if segment.seq < ack_seq:
+                segment.close(delete=True)
+                continue
+            segment.scan()
+            self._segments.append(segment)
+
+        self._next_seq = max([ack_seq] + [segment.seq for segment in self._segments]) + 1
+        if self._segments and self._segments[0].seq == ack_seq:
+            self._read_index = min(ack_index, len(self._segments[0].offsets))
+        # Delete the segments acknowledged to the end
+        while self._segments and self._read_index >= len(self._segments[0].offsets):
+            self._read_index = 0
+            self._segments.pop(0).close(delete=True)
+        self._count = sum(len(segment.offsets) for segment in self._segments) - self._read_index
+        if self._count:
+            self._log.info("Segment buffer (%s) restored %d items from %s",
+                           self._bufferName, self._count, self._path)
+
+    def _new_segment(self):
+        seq = self._next_seq
+        self._next_seq += 1
+        segment = _Segment(os.path.join(self._path, "%010d.seg" % seq), seq, self._segment_size)
+        self._segments.append(segment)
+        return segment
+
+    def _write_ack(self):
+        # Everything before this segment and index has been acknowledged
+        seq = self._segments[0].seq if self._segments else self._next_seq
+        tmp = self._ack_filename + ".tmp"
+        with open(tmp, 'w') as f:
+            f.write("%d %d" % (seq, self._read_index))
+        os.replace(tmp, self._ack_filename)
+        self._last_ack = time.time()
+
+    @staticmethod
+    def _encode(data):
+        """Return the record kind and payload for a frame"""
+        try:
+            if type(data) is list and len(data) >= 2 and type(data[1]) is int:
+                timestamp, node, values = data[0], data[1], data[2:]
+                head = _SEGMENT_FRAME.pack(timestamp, node)
+                count = len(values)
+                packed = struct.pack('<%df' % count, *values)
+                if list(struct.unpack('<%df' % count, packed)) == values:
+                    return _SEGMENT_FLOAT32, head + packed
+                packed = struct.pack('<%dd' % count, *values)
+                if list(struct.unpack('<%dd' % count, packed)) == values:
+                    return _SEGMENT_FLOAT64, head + packed
+        except (struct.error, TypeError):
+            pass
+        return _SEGMENT_JSON, json.dumps(data).encode()
+
+    def hasItems(self):
+        return self._count > 0
+
+    def isFull(self):
+        return self._count >= self._maximumEntriesInBuffer
+
+    def fillLevel(self):
+        level = self._count / self._maximumEntriesInBuffer
+        if self._maximumBytesInBuffer:
+            level = max(level, self.bytes() / self._maximumBytesInBuffer)
+        return level
+
+    def bytes(self):
+        """Size of the segment files held, in bytes."""
+        return len(self._segments) * self._segment_size
+
+    def discardOldestItemsIfFull(self, new_segment=False):
+        if self.isFull():
+            self._log.warning(
+                "Segment buffer (%s) reached limit of %d items, deleting oldest",
+                self._bufferName, self._maximumEntriesInBuffer)
+            self.discardLastRetrievedItems(self._count - self._maximumEntriesInBuffer + 1)
+        # Make room for a new segment file by deleting the oldest ones
+        if new_segment and self._maximumBytesInBuffer \
+                and self.bytes() + self._segment_size > self._maximumBytesInBuffer:
+            self._log.warning(
+                "Segment buffer (%s) reached limit of %d bytes, deleting oldest segment",
+                self._bufferName, self._maximumBytesInBuffer)
+            while self._count and self.bytes() + self._segment_size > self._maximumBytesInBuffer:
+                self.discardLastRetrievedItems(len(self._segments[0].offsets) - self._read_index)
 
-    def retrieveItems(self, number):
-        blen = len(self._data_buffer)
-        if number > blen:
-            number = blen
-        return self._data_buffer[:number]
+    def storeItem(self, data):
+        kind, payload = self._encode(data)
+        length = _SEGMENT_HEADER.size + len(payload)
+        if length > self._segment_size:
+            self._log.warning("Segment buffer (%s) item of %d bytes larger than segment_size, discarded",
+                              self._bufferName, len(payload))
+            return
+        self.discardOldestItemsIfFull(not self._segments or
+                                      self._segments[-1].write_pos + length > self._segment_size)
+        segment = self._segments[-1] if self._segments else self._new_segment()
+        if not segment.append(kind, payload):
+            # Full, written out before moving on to the next segment
+            segment.mm.flush()
+            self._new_segment().append(kind, payload)
+        self._count += 1
+
+    def retrieveItem(self):
+        return self.retrieveItems(1)[0]
+
+    def retrieveItems(self, number, offset=0):
+        items = []
+        index = self._read_index + offset
+        for segment in self._segments:
+            if index >= len(segment.offsets):
+                index -= len(segment.offsets)
+                continue
+            while index < len(segment.offsets) and len(items) < number:
+                items.append(segment.read(index))
+                index += 1
+            if len(items) >= number:
+                break
+            index = 0
+        return items
 
     def discardLastRetrievedItem(self):
-        del self._data_buffer[0]
+        self.discardLastRetrievedItems(1)
 
     def discardLastRetrievedItems(self, number):
-        blen = len(self._data_buffer)
-        if number > blen:
-            number = blen
-        self._data_buffer = self._data_buffer[number:]
+        number = min(number, self._count)
+        if number <= 0:
+            return
+        self._count -= number
+        self._read_index += number
+        deleted = False
+        # Delete the segments that have been read to the end, bar the one being written
+        while len(self._segments) > 1 and self._read_index >= len(self._segments[0].offsets):
+            self._read_index -= len(self._segments[0].offsets)
+            self._segments.pop(0).close(delete=True)
+            deleted = True
+        if len(self._segments) == 1 and not self._count:
+            # Start afresh once everything has been acknowledged
+            self._segments.pop().close(delete=True)
+            self._read_index = 0
+            deleted = True
+        # Rewriting the ack file on every discard would wear the SD card
+        if deleted or time.time() - self._last_ack >= self._ack_interval:
+            self._write_ack()
 
     def size(self):
-        return len(self._data_buffer)
+        return self._count
+
+    def close(self):
+        self._write_ack()
+        for segment in self._segments:
+            segment.mm.flush()
+            segment.close()
+        self._segments = []
 
 
 """
@@ -101,7 +870,10 @@ The getBuffer function returns the buffer class corresponding to a
 buffering method passed as argument.
 """
 bufferMethodMap = {
-                   'memory': InMemoryBuffer
+                   'memory': InMemoryBuffer,
+                   'sqlite': SQLiteBuffer,
+                   'segment': SegmentBuffer,
+                   'compressed': CompressedBuffer
                   }
 
 
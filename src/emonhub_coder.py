@@ -1,42 +1,220 @@
 import struct
+import threading
 
 # Initialize nodes data
 # FIXME this shouldn't live here
 nodelist = {}
 
+# Compiled structs by format, see get_struct()
+_structs = {}
+
+
+def get_struct(datacodes):
+    """Return a compiled little-endian struct for a datacode string.
+
+    datacodes (string): struct format without byte order, e.g. 'hhL'
+
+    Structs are compiled once and shared, raises struct.error if invalid.
+
+    """
+    s = _structs.get(datacodes)
+    if s is None:
+        # Ensure little-endian & standard sizes used
+        s = _structs[datacodes] = struct.Struct('<' + datacodes)
+    return s
+
 
 def check_datacode(datacode):
-    # Ensure little-endian & standard sizes used
-    e = '<'
     try:
-        return struct.calcsize(e + datacode)
+        return get_struct(datacode).size
     except struct.error:
         return False
 
 
 def decode(datacode, frame):
-    # Ensure little-endian & standard sizes used
-    e = '<'
+    # frame is the list of byte values of a single value
+    return get_struct(datacode[0]).unpack(bytes(frame))[0]
 
-    # set the base data type to bytes
-    b = 'B'
+def encode(datacode, value):
+    # returns the byte values of value
+    return tuple(get_struct(datacode).pack(value))
 
-    # get data size from data code
-    s = int(check_datacode(datacode))
 
-    result = struct.unpack(e + datacode[0], struct.pack(e + b*s, *frame))
-    return result[0]
+def decode_bytes(datacodes, buffer, offset=0):
+    """Decode values straight from a buffer.
 
-def encode(datacode, value):
-    # Ensure little-endian & standard sizes used
-    e = '<'
+    datacodes (string or list): one datacode per value
+    buffer (bytes, bytearray or memoryview): raw frame
+    offset (int): position of the first value in buffer
+
+    Return the values as a tuple.
+
+    """
+    if not isinstance(datacodes, str):
+        datacodes = ''.join(datacodes)
+    return get_struct(datacodes).unpack_from(buffer, offset)
+
+
+def decode_many(datacodes, frame):
+    """Decode a whole frame in one call.
+
+    datacodes (string or list): a datacode per value, or a single datacode
+        repeated over the frame
+    frame (list or bytes): byte values of the frame, whose length must match
+
+    Return the values as a list.
+
+    """
+    if not isinstance(frame, (bytes, bytearray, memoryview)):
+        frame = bytes(frame)
+    if not isinstance(datacodes, str):
+        datacodes = ''.join(datacodes)
+    elif len(datacodes) == 1:
+        datacodes = datacodes * (len(frame) // get_struct(datacodes).size)
+    return list(get_struct(datacodes).unpack(frame))
+
+
+# Incremented when nodelist is replaced or edited, see set_nodelist()
+nodelist_version = 0
+
+# Compiled node decoders by (node, default datacode, default scale)
+_decoders = {}
+# Held to clear _decoders or add to it, so that a decoder compiled from
+# the old nodelist is never cached after nodelist_changed()
+_decoders_lock = threading.Lock()
+
+
+def set_nodelist(nodes):
+    """Replace the node list, dropping the decoders compiled from the old one."""
+    global nodelist
+    nodelist = nodes
+    nodelist_changed()
+
+
+def nodelist_changed():
+    """To be called after editing nodelist in place."""
+    global nodelist_version
+    with _decoders_lock:
+        nodelist_version += 1
+        _decoders.clear()
+
+
+def get_decoder(node, datacode, scale):
+    """Return the decoder for a node, compiled on first use.
+
+    node (string): node id as used in nodelist
+    datacode, scale: interfacer defaults for nodes without their own
+
+    """
+    try:
+        key = (node, datacode, scale)
+        decoder = _decoders.get(key)
+    except TypeError:
+        # unhashable (invalid) default, compile without caching
+        return NodeDecoder(nodelist.get(node, {}), datacode, scale)
+    if decoder is None:
+        # Compiled outside the lock, and only cached if nodelist has not
+        # changed meanwhile, the caller still uses it for the frame in hand
+        version = nodelist_version
+        decoder = NodeDecoder(nodelist.get(node, {}), datacode, scale)
+        with _decoders_lock:
+            if version == nodelist_version:
+                _decoders[key] = decoder
+    return decoder
+
+
+class NodeDecoder:
+    """Decoding of a node's rx frames, compiled from its nodelist entry.
+
+    Frames are decoded with one registry struct per frame length and
+    scaled with a precomputed vector of factors, None meaning unscaled.
+
+    """
+
+    def __init__(self, node_settings, datacode, scale):
+        rx = node_settings.get('rx', {})
+
+        self.nodename = node_settings.get('nodename', False)
+        self.names = tuple(rx['names']) if 'names' in rx else None
+
+        whitening = rx.get('whitening', False)
+        self.whitening = whitening is True or whitening == "1"
+
+        # Per value datacodes, or a single datacode for any number of values
+        self.error = None
+        self.datacodes = None
+        self.datacode = 0
+        self.size = 0
+        if 'datacodes' in rx:
+            self.datacodes = [str(code) for code in rx['datacodes']]
+            try:
+                self._struct = get_struct(''.join(self.datacodes))
+            except struct.error:
+                self.error = "invalid datacodes %s" % self.datacodes
+            else:
+                self.size = self._struct.size
+        else:
+            datacode = rx.get('datacode', datacode)
+            if isinstance(datacode, list):
+                self.error = "datacode should be str, not list. Did you mean datacodes?"
+            # Ensure only int 0 is passed not str 0
+            elif datacode != '0' and datacode:
+                self.datacode = datacode
+                self.size = check_datacode(datacode)
+                if not self.size:
+                    self.error = "invalid datacode %s" % datacode
+
+        # Per value scales (a single one is ignored), or a single scale for all values
+        self.scales = None
+        self.scale = None
+        if 'scales' in rx:
+            if len(rx['scales']) > 1:
+                self.scales = [None if x == "1" else float(x) for x in rx['scales']]
+        else:
+            scale = rx.get('scale', scale)
+            if scale != "1":
+                self.scale = float(scale)
+
+    def check_length(self, length):
+        """Return True if a frame of length bytes can be decoded."""
+        if self.datacodes is not None:
+            return length == self.size
+        return length % self.size == 0
 
-    # set the base data type to bytes
-    b = 'B'
+    def decode(self, frame):
+        """Decode a frame of byte values, as listed or bytes."""
+        if not isinstance(frame, (bytes, bytearray)):
+            frame = bytes(map(int, frame))
+        if self.datacodes is not None:
+            return list(self._struct.unpack(frame))
+        return list(get_struct('%d%s' % (len(frame) // self.size, self.datacode)).unpack(frame))
 
-    # get data size from data code
-    s = int(check_datacode(datacode))
+    def decode_frames(self, frames):
+        """Decode frames of equal or valid lengths together, return a list of value lists."""
+        frames = [f if isinstance(f, (bytes, bytearray)) else bytes(map(int, f)) for f in frames]
+        length = len(frames[0])
+        if any(len(f) != length for f in frames):
+            return [self.decode(f) for f in frames]
+        if self.datacodes is not None:
+            s = self._struct
+        else:
+            s = get_struct('%d%s' % (length // self.size, self.datacode))
+        return [list(values) for values in s.iter_unpack(b''.join(frames))]
 
-    #value = 60
-    #datacode = "b"
-    return struct.unpack(e + b*s, struct.pack(e + datacode, value))
+    def apply_scales(self, values):
+        """Scale decoded values in place."""
+        if self.scales is not None:
+            scales = self.scales
+            count = len(scales)
+            for i in range(len(values)):
+                # values beyond the listed scales are scaled by 1
+                x = scales[i] if i < count else 1.0
+                if x is not None:
+                    val = values[i] * x
+                    values[i] = int(val) if val % 1 == 0 else float(val)
+        elif self.scale is not None:
+            x = self.scale
+            for i in range(len(values)):
+                val = values[i] * x
+                values[i] = int(val) if val % 1 == 0 else float(val)
+        return values
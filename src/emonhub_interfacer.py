@@ -8,9 +8,11 @@
 """
 
 import time
+import random
 import logging
 import threading
 import traceback
+from collections import deque
 
 import emonhub_coder as ehc
 import emonhub_buffer as ehb
@@ -34,6 +36,11 @@ def log_exceptions_from_class_method(func):
     return wrapper
 
 class EmonHubInterfacer(threading.Thread):
+
+    # Read interval multiplier applied by polling sources once the fill
+    # level reported by the sinks of their pub channels reaches a threshold
+    backpressure_steps = ((0.9, 8), (0.75, 4), (0.5, 2))
+
     def __init__(self, name):
         # Initialise logger
         self._log = logging.getLogger("EmonHub")
@@ -53,7 +60,12 @@ class EmonHubInterfacer(threading.Thread):
                           'pubchannels': [],
                           'subchannels': [],
                           'batchsize': '1',
-                          'nodelistonly': False
+                          'nodelistonly': False,
+                          'channel_size': '1000',
+                          'channel_overflow': 'drop_oldest',
+                          'retry_interval': '10',
+                          'retry_max_interval': '600',
+                          'retry_failures': '5'
                           }
 
         self.init_settings = {}
@@ -63,6 +75,16 @@ class EmonHubInterfacer(threading.Thread):
         self._sub_channels = {}
         self._pub_channels = {}
 
+        # Router notified on publish, set by the hub
+        self._router = None
+
+        # Set by the router when cargo is delivered to a sub channel
+        self._wakeup = threading.Event()
+
+        # Sink fill level and read interval multiplier by pub channel, set by the router
+        self._backpressure = {}
+        self._backpressure_scale = {}
+
         # This line will stop the default values printing to logfile at start-up
         # unless they have been overwritten by emonhub.conf entries
         # comment out if diagnosing a startup value issue
@@ -71,9 +93,19 @@ class EmonHubInterfacer(threading.Thread):
         # Initialize interval timer's "started at" timestamp
         self._interval_timestamp = 0
 
+        # Spaces out attempts to reach a failing endpoint, see flush()
+        self._retry = EmonHubRetryPolicy(name)
+
         buffer_type = "memory"
         buffer_size = 1000
 
+        # Buffer init settings, interfacers may change these defaults and
+        # call init_buffer(), the hub applies the buffer_* init settings
+        self._buffer_settings = {'buffer_type': buffer_type,
+                                 'buffer_size': buffer_size,
+                                 'buffer_max_bytes': 0}
+        self._buffer_applied = dict(self._buffer_settings)
+
         # Create underlying buffer implementation
         self.buffer = ehb.getBuffer(buffer_type)(name, buffer_size)
 
@@ -97,40 +129,180 @@ class EmonHubInterfacer(threading.Thread):
         Any regularly performed tasks actioned here along with passing received values
 
         """
-        while not self.stop:
-
-            # Only read if there is a pub channel defined for the interfacer
-            if len(self._settings["pubchannels"]):
-                # Read the input and process data if available
-                rxc = self.read()
-                if rxc:
-                    rxc = self._process_rx(rxc)
+        try:
+            while not self.stop:
+
+                # Only read if there is a pub channel defined for the interfacer
+                if len(self._settings["pubchannels"]):
+                    # Read the input and process data if available
+                    # read() returns a cargo, or a list of them from sources that batch
+                    rxc = self.read()
                     if rxc:
-                        for channel in self._settings["pubchannels"]:
-                            self._log.debug("%d Sent to channel(start)' : %s", rxc.uri, channel)
+                        if isinstance(rxc, list):
+                            self.publish_many(self._process_rx_batch(rxc))
+                        else:
+                            rxc = self._process_rx(rxc)
+                            if rxc:
+                                self.publish(rxc)
+
+                # Subscriber channels
+                for channel in self._settings["subchannels"]:
+                    if channel in self._sub_channels:
+                        for frame in self._sub_channels[channel].get_all():
+                            self.add(frame)
+
+                # Don't loop too fast, but wake as soon as the router delivers
+                self._wakeup.wait(0.1)
+                self._wakeup.clear()
+                # Action reporter tasks
+                self.action()
+        finally:
+            # Write out anything the buffer still holds in memory, also when
+            # the thread dies, and release it
+            self.buffer.close()
+
+    def init_buffer(self, **settings):
+        """Create the buffer from the buffer_* init settings, called by the hub before start.
+
+        buffer_type (string): key of emonhub_buffer.bufferMethodMap
+        buffer_size (int): maximum number of items
+        buffer_max_bytes (int): maximum size of the items, 0 for no limit
+        other buffer_* settings are passed on to the buffer without the
+        prefix (e.g. buffer_path = /var/lib/emonhub for the sqlite buffer)
+
+        Settings not given keep the interfacer's defaults.
 
-                            # Initialise channel if needed
-                            if channel not in self._pub_channels:
-                                self._pub_channels[channel] = []
+        """
+        settings = dict(self._buffer_settings, **settings)
+        if settings == self._buffer_applied:
+            return
 
-                            # Add cargo item to channel
-                            self._pub_channels[channel].append(rxc)
+        options = {key[len("buffer_"):]: value for key, value in settings.items()}
+        buffer_type = options.pop('type')
+        if buffer_type not in ehb.bufferMethodMap:
+            raise EmonHubInterfacerInitError("Unknown buffer_type '%s', use one of %s"
+                                             % (buffer_type, ", ".join(ehb.bufferMethodMap)))
+        try:
+            buffer_size = int(options.pop('size'))
+            if buffer_size < 1:
+                raise ValueError("buffer_size must be at least 1")
+            buffer = ehb.getBuffer(buffer_type)(self.name, buffer_size, **options)
+        except Exception as e:
+            raise EmonHubInterfacerInitError("Unable to create %s buffer: %s" % (buffer_type, e))
+        self.buffer.close()
+        self.buffer = buffer
+        # The item limit follows the buffer size, unless the interfacer set its own
+        if self._item_limit == int(self._buffer_applied['buffer_size']):
+            self._item_limit = buffer_size
+        self._buffer_applied = settings
+        self._log.info("%s using %s buffer, %d items", self.name, buffer_type, buffer_size)
+
+    def publish(self, cargo):
+        """Add cargo to each pub channel and notify the router.
+
+        The cargo is frozen as from here on it is shared with the subscribers.
+
+        cargo (EmonHubCargo): processed cargo ready to be routed
+
+        """
+        cargo.freeze()
+
+        for channel in self._settings["pubchannels"]:
+            self._log.debug("%d Sent to channel(start)' : %s", cargo.uri, channel)
+
+            # Add cargo item to channel
+            self._get_channel(self._pub_channels, channel).put(cargo)
 
-                            self._log.debug("%d Sent to channel(end)' : %s", rxc.uri, channel)
+            self._log.debug("%d Sent to channel(end)' : %s", cargo.uri, channel)
 
-            # Subscriber channels
-            for channel in self._settings["subchannels"]:
-                if channel in self._sub_channels:
-                    # FIXME should be: while self._sub_channels[channel]
-                    for _ in range(len(self._sub_channels[channel])):
-                        # FIXME pop(0) has O(n) complexity. Can we use pop's default of last?
-                        frame = self._sub_channels[channel].pop(0)
-                        self.add(frame)
+        if self._router:
+            self._router.notify()
+
+    def publish_many(self, cargos):
+        """Add a batch of cargo to each pub channel and notify the router once.
+
+        cargos (list): processed EmonHubCargo objects, in order
+
+        """
+        if not cargos:
+            return
 
-            # Don't loop too fast
-            time.sleep(0.1)
-            # Action reporter tasks
-            self.action()
+        for cargo in cargos:
+            cargo.freeze()
+
+        for channel in self._settings["pubchannels"]:
+            self._log.debug("Sent %d cargo to channel : %s", len(cargos), channel)
+            self._get_channel(self._pub_channels, channel).put_many(cargos)
+
+        if self._router:
+            self._router.notify()
+
+    def deliver(self, channel, cargos):
+        """Add cargo to a sub channel and wake the interfacer, called by the router.
+
+        channel (string): sub channel name
+        cargos (list): EmonHubCargo objects
+
+        """
+        # Never block the router, a stalled sink would hold up every other
+        self._get_channel(self._sub_channels, channel).put_many(cargos, block=False)
+        self._wakeup.set()
+
+    def backpressure(self):
+        """Return how full this interfacer is as a sink, from 0 (empty) to 1 (full).
+
+        Reports the fuller of the buffer and the sub channels, sinks
+        with their own queueing can override this.
+
+        """
+        level = self.buffer.fillLevel()
+        for channel in list(self._sub_channels.values()):
+            level = max(level, len(channel) / channel.size)
+        return min(level, 1.0)
+
+    def set_backpressure(self, channel, level):
+        """Record the fill level of the sinks subscribed to a pub channel, called by the router.
+
+        channel (string): pub channel name
+        level (float): fill level of the fullest subscriber, from 0 to 1
+
+        """
+        self._backpressure[channel] = level
+
+        scale = 1
+        for threshold, step in self.backpressure_steps:
+            if level >= threshold:
+                scale = step
+                break
+
+        if scale != self._backpressure_scale.get(channel, 1):
+            if scale > 1:
+                self._log.warning("%s backpressure on channel %s: sinks %d%% full, read interval x%d",
+                                  self.name, channel, level * 100, scale)
+            else:
+                self._log.info("%s backpressure on channel %s cleared: sinks %d%% full",
+                               self.name, channel, level * 100)
+        self._backpressure_scale[channel] = scale
+
+    def read_interval_scale(self):
+        """Return the multiplier polling sources should apply to their read interval.
+
+        Sources that can slow down (meter and HTTP pollers) use this to
+        stretch their interval rather than produce data the sinks would
+        have to discard.
+
+        """
+        return max(self._backpressure_scale.values(), default=1)
+
+    def _get_channel(self, channels, name):
+        """Return the named pub or sub channel, created on first use."""
+        channel = channels.get(name)
+        if channel is None:
+            channel = channels.setdefault(name, EmonHubChannel(
+                self.name + "/" + name,
+                int(self._settings['channel_size']),
+                self._settings['channel_overflow']))
+        return channel
 
     def add(self, cargo):
         """Append data to buffer.
@@ -171,7 +343,8 @@ class EmonHubInterfacer(threading.Thread):
     def read(self):
         """Read raw data from interface and pass for processing.
         Specific version to be created for each interfacer
-        Returns an EmonHubCargo object
+        Returns an EmonHubCargo object, or a list of them when several
+        frames are ready at once
         """
         pass
 
@@ -183,6 +356,12 @@ class EmonHubInterfacer(threading.Thread):
         """
         pass
 
+    def close(self):
+        """Release the ports or connections opened by the interfacer.
+        Specific version to be created by interfacers that open any
+        """
+        pass
+
 
     def action(self):
         """
@@ -199,6 +378,9 @@ class EmonHubInterfacer(threading.Thread):
         if int(self._settings['interval']) \
                 and time.time() - self._interval_timestamp < int(self._settings['interval']):
             return
+        # Wait longer after failed posts
+        elif not self.buffer.hasItems() or not self._retry.ready():
+            return
         else:
             # Then attempt to flush the buffer
             self.flush()
@@ -222,6 +404,9 @@ class EmonHubInterfacer(threading.Thread):
             if self._process_post(databuffer):
                 # In case of success, delete sample set from buffer
                 self.buffer.discardLastRetrievedItems(retrievedlength)
+                self._retry.success()
+            else:
+                self._retry.failure()
             # log the time of last successful post
             # slow down retry rate in the case where the last attempt failed
             # stops continuous retry attempts filling up the log
@@ -248,15 +433,71 @@ class EmonHubInterfacer(threading.Thread):
 
         Return data as a list: [NodeID, val1, val2]
 
+        """
+        decoder = self._check_rx(cargo)
+        if not decoder:
+            return False
+
+        decoded = self._decode_rx(cargo, decoder)
+        if decoded is False:
+            return False
+
+        return self._complete_rx(cargo, decoder, decoded)
+
+    def _process_rx_batch(self, cargos):
+        """Process a batch of frames, as returned by read()
+
+        Frames from the same node are decoded together. Sources that
+        override _process_rx have it called for each frame instead.
+
+        Return the processed cargo, in the order received.
+
+        """
+        if type(self)._process_rx is not EmonHubInterfacer._process_rx:
+            return [rxc for rxc in map(self._process_rx, cargos) if rxc]
+
+        # Check each frame and group the valid ones by decoder
+        decoders = [self._check_rx(cargo) for cargo in cargos]
+        groups = {}
+        for i, decoder in enumerate(decoders):
+            if decoder:
+                groups.setdefault(id(decoder), []).append(i)
+
+        decoded = [False] * len(cargos)
+        for group in groups.values():
+            decoder = decoders[group[0]]
+            if decoder.size and len(group) > 1:
+                try:
+                    values = decoder.decode_frames([cargos[i].realdata for i in group])
+                except Exception:
+                    # A bad frame in the group, decode them one by one
+                    pass
+                else:
+                    for i, v in zip(group, values):
+                        decoded[i] = v
+                    continue
+            for i in group:
+                decoded[i] = self._decode_rx(cargos[i], decoder)
+
+        # Complete in the order received, missed packet counts depend on it
+        processed = []
+        for cargo, decoder, values in zip(cargos, decoders, decoded):
+            if values is not False:
+                processed.append(self._complete_rx(cargo, decoder, values))
+        return processed
+
+    def _check_rx(self, cargo):
+        """Check a frame can be decoded
+
+        Return the node's decoder, False if the frame is discarded.
+
         """
 
         # Log data
         self._log.debug("%d NEW FRAME : %s", cargo.uri, cargo.rawdata)
 
         rxc = cargo
-        decoded = []
         node = str(rxc.nodeid)
-        datacode = True
 
         # Discard if data is non-existent
         if len(rxc.realdata) < 1:
@@ -290,133 +531,67 @@ class EmonHubInterfacer(threading.Thread):
                     del ehc.nodelist[node]['nodeids']
                 if 'datalength' in ehc.nodelist[node]:
                     del ehc.nodelist[node]['datalength']      
-                    
+                ehc.nodelist_changed()
                     
         # If not in nodelist and pass through disabled return false
         if node not in ehc.nodelist and self._settings['nodelistonly']:
             self._log.warning("%d Discarded RX frame not in nodelist, node:%s, length:%s bytes", cargo.uri, node, len(rxc.realdata))
             return False
-            
-        # Data whitening uses for ensuring rfm sync
-        if node in ehc.nodelist and 'rx' in ehc.nodelist[node] and 'whitening' in ehc.nodelist[node]['rx']:
-            whitening = ehc.nodelist[node]['rx']['whitening']
-            if whitening is True or whitening == "1":
-                rxc.realdata = [x ^ 0x55 for x in rxc.realdata]
 
-        # check if node is listed and has individual datacodes for each value
-        if node in ehc.nodelist and 'rx' in ehc.nodelist[node] and 'datacodes' in ehc.nodelist[node]['rx']:
-            # fetch the string of datacodes
-            datacodes = ehc.nodelist[node]['rx']['datacodes'].copy()
+        # Decoder compiled from the node's nodelist entry, or the interfacer defaults
+        decoder = ehc.get_decoder(node, self._settings['datacode'], self._settings['scale'])
+        if decoder.error:
+            self._log.warning("%d %s", rxc.uri, decoder.error)
+            return False
 
-            # fetch a string of data sizes based on the string of datacodes
-            datasizes = []
-            for code in datacodes:
-                datasizes.append(ehc.check_datacode(str(code)))
-            # Discard the frame & return 'False' if it doesn't match the summed datasizes
-            if len(rxc.realdata) != sum(datasizes):
+        # Data whitening uses for ensuring rfm sync
+        if decoder.whitening:
+            rxc.realdata = [x ^ 0x55 for x in rxc.realdata]
+
+        # Discard the frame if its size does not match the datacode(s)
+        if decoder.size and not decoder.check_length(len(rxc.realdata)):
+            if decoder.datacodes is not None:
                 self._log.warning("%d RX data length: %d is not valid for datacodes %s",
-                                  rxc.uri, len(rxc.realdata), datacodes)
-                return False
-            else:
-                # Determine the expected number of values to be decoded
-                count = len(datacodes)
-                # Set decoder to "Per value" decoding using datacode 'False' as flag
-                datacode = False
-        else:
-            # if node is listed, but has only a single default datacode for all values
-            if node in ehc.nodelist and 'rx' in ehc.nodelist[node] and 'datacode' in ehc.nodelist[node]['rx']:
-                datacode = ehc.nodelist[node]['rx']['datacode']
+                                  rxc.uri, len(rxc.realdata), decoder.datacodes)
             else:
-                # when node not listed or has no datacode(s) use the interfacers default if specified
-                datacode = self._settings['datacode']
-            if isinstance(datacode, list):
-                self._log.warning("%d datacode should be str, not list. Did you mean datacodes?")
-                return False
-            # Ensure only int 0 is passed not str 0
-            if datacode == '0':
-                datacode = 0
-            # when no (default)datacode(s) specified, pass string values back as numerical values
-            if not datacode:
-                for val in rxc.realdata:
-                    if float(val) % 1 != 0:
-                        val = float(val)
-                    else:
-                        val = int(float(val))
-                    decoded.append(val)
-            # Discard frame if total size is not an exact multiple of the specified datacode size.
-            elif len(rxc.realdata) % ehc.check_datacode(datacode) != 0:
                 self._log.warning("%d RX data length: %d is not valid for datacode %s",
-                                  rxc.uri, len(rxc.realdata), datacode)
-                return False
-            else:
-            # Determine the number of values in the frame of the specified code & size
-                count = len(rxc.realdata) // ehc.check_datacode(datacode)
+                                  rxc.uri, len(rxc.realdata), decoder.datacode)
+            return False
 
-        # Decode the string of data one value at a time into "decoded"
-        if not decoded:
-            bytepos = 0
-            for i in range(count):
-                # Use single datacode unless datacode = False then use datacodes
-                dc = str(datacode)
-                if not datacode:
-                    dc = str(datacodes[i])
-                # Determine the number of bytes to use for each value by it's datacode
-                size = int(ehc.check_datacode(dc))
-                try:
-                    value = ehc.decode(dc, [int(v) for v in rxc.realdata[bytepos:bytepos+size]])
-                except Exception:
-                    self._log.warning("%d Unable to decode as values incorrect for datacode(s)", rxc.uri)
-                    return False
-                bytepos += size
-                decoded.append(value)
+        return decoder
 
-        # check if node is listed and has individual scales for each value
-        if node in ehc.nodelist and 'rx' in ehc.nodelist[node] and 'scales' in ehc.nodelist[node]['rx']:
-            scales = ehc.nodelist[node]['rx']['scales'].copy()
-            # === Removed check for scales length so that failure mode is more gracious ===
-            # Discard the frame & return 'False' if it doesn't match the number of scales
-            # if len(decoded) != len(scales):
-            #     self._log.warning("%d Scales %s for RX data : %s not suitable", rxc.uri, scales, rxc.realdata)
-            #     return False
-            # else:
-                  # Determine the expected number of values to be decoded
-                  # Set decoder to "Per value" scaling using scale 'False' as flag
-            #     scale = False
-            if len(scales) > 1:
-                scale = False
-            else:
-                scale = "1"
-        else:
-            # if node is listed, but has only a single default scale for all values
-            if node in ehc.nodelist and 'rx' in ehc.nodelist[node] and 'scale' in ehc.nodelist[node]['rx']:
-                scale = ehc.nodelist[node]['rx']['scale']
-            else:
-            # when node not listed or has no scale(s) use the interfacers default if specified
-                scale = self._settings['scale']
+    def _decode_rx(self, cargo, decoder):
+        """Decode a checked frame, return its values or False if invalid"""
 
-        if scale != "1":
-            # FIXME replace with zip
-            for i in range(len(decoded)):
-                x = scale
-                if not scale:
-                    if i < len(scales):
-                        x = scales[i]
-                    else:
-                        x = 1
+        # when no (default)datacode(s) specified, pass string values back as numerical values
+        if not decoder.size:
+            decoded = []
+            for val in cargo.realdata:
+                if float(val) % 1 != 0:
+                    val = float(val)
+                else:
+                    val = int(float(val))
+                decoded.append(val)
+            return decoded
 
-                if x != "1":
-                    val = decoded[i] * float(x)
-                    if val % 1 == 0:
-                        decoded[i] = int(val)
-                    else:
-                        decoded[i] = float(val)
+        # Decode the whole frame in one go
+        try:
+            return decoder.decode(cargo.realdata)
+        except Exception:
+            self._log.warning("%d Unable to decode as values incorrect for datacode(s)", cargo.uri)
+            return False
 
-        rxc.realdata = decoded
-        names = rxc.names
+    def _complete_rx(self, cargo, decoder, decoded):
+        """Scale and name the decoded values, return the processed cargo"""
 
-        if node in ehc.nodelist and 'rx' in ehc.nodelist[node] and 'names' in ehc.nodelist[node]['rx']:
-            names = ehc.nodelist[node]['rx']['names'].copy()
-        rxc.names = names
+        rxc = cargo
+        node = str(rxc.nodeid)
+
+        rxc.realdata = decoder.apply_scales(decoded)
+
+        if decoder.names is not None:
+            rxc.names = list(decoder.names)
+        names = rxc.names
          
         # Count missed packets
         if len(names) and names[0].upper()=="MSG":
@@ -445,20 +620,18 @@ class EmonHubInterfacer(threading.Thread):
             rxc.realdata.append(missedprc)
             rxc.names.append('missedprc')
             
-        nodename = False
-        if node in ehc.nodelist and 'nodename' in ehc.nodelist[node]:
-            nodename = ehc.nodelist[node]['nodename']
-        rxc.nodename = nodename
+        rxc.nodename = decoder.nodename
 
         if not rxc:
             return False
-        self._log.debug("%d Timestamp : %f", rxc.uri, rxc.timestamp)
-        self._log.debug("%d From Node : %s", rxc.uri, str(rxc.nodeid))
-        if rxc.target:
-            self._log.debug("%d To Target : %d", rxc.uri, rxc.target)
-        self._log.debug("%d    Values : %s", rxc.uri, rxc.realdata)
-        if rxc.rssi:
-            self._log.debug("%d      RSSI : %d", rxc.uri, rxc.rssi)
+        if self._log.isEnabledFor(logging.DEBUG):
+            self._log.debug("%d Timestamp : %f", rxc.uri, rxc.timestamp)
+            self._log.debug("%d From Node : %s", rxc.uri, str(rxc.nodeid))
+            if rxc.target:
+                self._log.debug("%d To Target : %d", rxc.uri, rxc.target)
+            self._log.debug("%d    Values : %s", rxc.uri, rxc.realdata)
+            if rxc.rssi:
+                self._log.debug("%d      RSSI : %d", rxc.uri, rxc.rssi)
 
         return rxc
 
@@ -469,13 +642,14 @@ class EmonHubInterfacer(threading.Thread):
         and then break the real values down into byte values,
         Uses the datacode data if available.
 
-        DO NOT OVER-WRITE THE "REAL" VALUE DATA WITH ENCODED DATA !!!
-        there may be other threads that need to use cargo.realdata to
-        encode data for other targets.
+        The cargo received is frozen and shared with other threads that
+        may need cargo.realdata to encode data for other targets, so it is
+        left untouched.
 
-        New "encoded" data is stored as a list of {interfacer:encoded-data} dicts.
+        New "encoded" data is returned in an overlay of the cargo holding
+        {interfacer:encoded-data}, the rest of the payload is shared.
 
-        Returns cargo.
+        Returns the overlay.
         """
 
         txc = cargo
@@ -597,8 +771,7 @@ class EmonHubInterfacer(threading.Thread):
 
         # self._log.info("Encoded: %s", json.dumps(encoded))
 
-        txc.encoded.update({self.getName():encoded})
-        return txc
+        return txc.overlay(encoded={self.getName(): encoded})
 
     def set(self, **kwargs):
         """Set configuration parameters.
@@ -638,6 +811,13 @@ class EmonHubInterfacer(threading.Thread):
                 setting = str(setting).lower() == "true"
             elif key == 'nodelistonly' and str(setting).lower() in ['true', 'false','1','0']:
                 setting = str(setting).lower() == "true" or str(setting).lower() == "1"
+            elif key == 'channel_size' and str(setting).isdigit() and int(setting) > 0:
+                pass
+            elif key == 'channel_overflow' and str(setting) in EmonHubChannel.overflow_policies:
+                pass
+            elif key in ['retry_interval', 'retry_max_interval', 'retry_failures'] \
+                    and str(setting).isdigit() and int(setting) > 0:
+                pass
             elif key == 'pubchannels':
                 pass
             elif key == 'subchannels':
@@ -648,6 +828,166 @@ class EmonHubInterfacer(threading.Thread):
             self._settings[key] = setting
             self._log.debug("Setting %s %s: %s", self.name, key, setting)
 
+        # Apply channel settings to the channels already in use
+        for channel in list(self._pub_channels.values()) + list(self._sub_channels.values()):
+            channel.size = int(self._settings['channel_size'])
+            channel.overflow = self._settings['channel_overflow']
+
+        self._retry.interval = int(self._settings['retry_interval'])
+        self._retry.max_interval = int(self._settings['retry_max_interval'])
+        self._retry.failures = int(self._settings['retry_failures'])
+
+
+"""class EmonHubChannel
+
+Bounded, thread-safe queue of cargo used for the interfacers pub and sub
+channels. Cargo is put by one thread (interfacer or router) and taken in
+bulk by another.
+
+When full the overflow policy decides what happens to new cargo:
+    drop_oldest  discard the oldest queued cargo to make room (default)
+    drop_newest  discard the new cargo
+    block        wait up to block_timeout seconds in all for room, then
+                 discard the new cargo; only the interfacer publishing
+                 waits, cargo the router delivers is discarded at once
+                 so one stalled sink does not hold up the others
+
+Discarded cargo is counted in 'dropped'.
+
+"""
+class EmonHubChannel:
+
+    overflow_policies = ('drop_oldest', 'drop_newest', 'block')
+
+    def __init__(self, name, size=1000, overflow='drop_oldest', block_timeout=1.0):
+        self._log = logging.getLogger("EmonHub")
+        self.name = name
+        self.size = size
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.dropped = 0
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+
+    def __len__(self):
+        return len(self._queue)
+
+    def put(self, cargo):
+        """Add one cargo, return the number of cargo discarded."""
+        return self.put_many((cargo,))
+
+    def put_many(self, cargos, block=True):
+        """Add cargo in order, return the number of cargo discarded.
+
+        block (bool): False when called from the router, the block policy
+            then discards new cargo as drop_newest does
+
+        """
+        dropped = 0
+        deadline = None
+        with self._lock:
+            for cargo in cargos:
+                if len(self._queue) >= self.size:
+                    if self.overflow == 'drop_newest' or (self.overflow == 'block' and not block):
+                        dropped += 1
+                        continue
+                    elif self.overflow == 'block':
+                        # One deadline for the whole batch
+                        if deadline is None:
+                            deadline = time.time() + self.block_timeout
+                        timeout = max(deadline - time.time(), 0)
+                        if not self._not_full.wait_for(lambda: len(self._queue) < self.size, timeout):
+                            dropped += 1
+                            continue
+                    else:
+                        while len(self._queue) >= self.size:
+                            self._queue.popleft()
+                            dropped += 1
+                self._queue.append(cargo)
+            self.dropped += dropped
+
+        if dropped:
+            self._log.warning("Channel %s full (%d items, %s), dropped %d (total %d)",
+                              self.name, self.size, self.overflow, dropped, self.dropped)
+        return dropped
+
+    def get_all(self):
+        """Remove and return all queued cargo, oldest first."""
+        with self._lock:
+            cargos = list(self._queue)
+            self._queue.clear()
+            self._not_full.notify_all()
+        return cargos
+
+
+"""class EmonHubRetryPolicy
+
+Spaces out attempts to reach a network endpoint that keeps failing, so a
+dead server or WAN outage is not hammered every interval.
+
+After each consecutive failure the wait before the next attempt doubles,
+from interval up to max_interval seconds, less a random jitter of up to
+half so that hubs sharing a server do not all retry at the same moment.
+
+After 'failures' consecutive failures the circuit opens: nothing is tried
+for max_interval seconds, then a single trial attempt is let through
+(half-open). Success closes the circuit again, failure reopens it.
+
+"""
+class EmonHubRetryPolicy:
+
+    def __init__(self, name, interval=10, max_interval=600, failures=5, jitter=0.5):
+        self._log = logging.getLogger("EmonHub")
+        self.name = name
+        self.interval = interval
+        self.max_interval = max_interval
+        self.failures = failures
+        self.jitter = jitter
+
+        # 'closed', 'open' or 'half-open'
+        self.state = 'closed'
+        # Consecutive failures
+        self.failed = 0
+        self._next_attempt = 0.0
+
+    def ready(self, now=None):
+        """Return True if an attempt may be made now."""
+        if now is None:
+            now = time.time()
+        if now < self._next_attempt:
+            return False
+        if self.state == 'open':
+            self.state = 'half-open'
+            self._log.info("%s trying again after %d failures", self.name, self.failed)
+        return True
+
+    def success(self):
+        """Record a successful attempt, closing the circuit."""
+        if not self.failed:
+            return
+        if self.state != 'closed':
+            self._log.info("%s reconnected after %d failures", self.name, self.failed)
+        self.state = 'closed'
+        self.failed = 0
+        self._next_attempt = 0.0
+
+    def failure(self, now=None):
+        """Record a failed attempt, return the seconds until the next one."""
+        if now is None:
+            now = time.time()
+        self.failed += 1
+        if self.state == 'half-open' or self.failed >= self.failures:
+            if self.state == 'closed':
+                self._log.warning("%s failed %d times, retrying every %d s", self.name, self.failed, self.max_interval)
+            self.state = 'open'
+            delay = self.max_interval
+        else:
+            delay = min(self.interval * 2 ** (self.failed - 1), self.max_interval)
+        delay *= 1 - random.uniform(0, self.jitter)
+        self._next_attempt = now + delay
+        return delay
+
 
 """class EmonHubInterfacerInitError
 
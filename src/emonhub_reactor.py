@@ -0,0 +1,205 @@
+"""
+
+  This code is released under the GNU Affero General Public License.
+
+  OpenEnergyMonitor project:
+  http://openenergymonitor.org
+
+"""
+
+import os
+import logging
+import selectors
+import threading
+
+"""class EmonHubLineFramer
+
+Splits a byte stream into lines.
+
+Bytes are accumulated in a bytearray and every complete line is split
+out at once, so several lines arriving together are all returned and
+nothing is decoded until the caller uses a line.
+
+"""
+
+class EmonHubLineFramer:
+
+    def __init__(self, delimiter=b"\r\n", max_length=65536):
+        """Initialize framer
+
+        delimiter (bytes): line ending
+        max_length (int): longest line kept while waiting for its end,
+            longer input is discarded
+
+        """
+        self._log = logging.getLogger("EmonHub")
+        self._buf = bytearray()
+        self.delimiter = delimiter
+        self.max_length = max_length
+
+    def __len__(self):
+        """Number of bytes received after the last complete line."""
+        return len(self._buf)
+
+    def feed(self, data):
+        """Add bytes received and return the lines they complete.
+
+        data (bytes): as read from the port or socket
+
+        Return a list of lines (bytes) without their ending, empty if no
+        line was completed.
+
+        """
+        buf = self._buf
+        delimiter = self.delimiter
+
+        # Only search the new bytes, and a delimiter split across reads
+        start = len(buf) - len(delimiter) + 1
+        buf += data
+        end = buf.rfind(delimiter, start if start > 0 else 0)
+        if end < 0:
+            if len(buf) > self.max_length:
+                self._log.warning("Discarding %d bytes received without a line ending", len(buf))
+                buf.clear()
+            return []
+
+        lines = bytes(buf[:end]).split(delimiter)
+        del buf[:end + len(delimiter)]
+        return lines
+
+    def clear(self):
+        """Drop any partial line."""
+        self._buf.clear()
+
+
+"""class EmonHubReactor
+
+Reads every registered serial port from a single thread.
+
+Ports are watched with selectors (epoll on Linux), whatever bytes are
+available are read as soon as they arrive and split into lines, and the
+complete lines are handed to the owning interfacer in one callback, so
+interfacers no longer poll their port with readline() and a sleep.
+
+"""
+
+class EmonHubReactor(threading.Thread):
+
+    # Bytes read from a port at a time
+    read_size = 4096
+
+    def __init__(self):
+        # Initialise logger
+        self._log = logging.getLogger("EmonHub")
+
+        # Initialise thread, daemonised as ports are closed by their interfacers
+        super().__init__(name="Reactor", daemon=True)
+
+        self._selector = selectors.DefaultSelector()
+
+        # Held while the registrations change and while a port is read, so
+        # once unregister() returns the port is no longer being read
+        self._lock = threading.Lock()
+
+        # Written to by register() so select() picks up new ports at once
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+
+        # create a stop
+        self.stop = False
+
+    def register(self, port, on_read, on_error, delimiter=b"\r\n"):
+        """Start reading a port.
+
+        port: open port with a fileno(), e.g. a serial.Serial
+        on_read (callable): called from the reactor thread with a list of
+            the complete lines read (bytes, without the line ending), or
+            with the bytes read if delimiter is None
+        on_error (callable): called from the reactor thread with the
+            exception once the port fails, the port is then unregistered
+        delimiter (bytes): line ending, None to pass bytes on as read
+
+        """
+        with self._lock:
+            framer = None if delimiter is None else EmonHubLineFramer(delimiter)
+            self._selector.register(port, selectors.EVENT_READ,
+                                    (framer, on_read, on_error))
+        self._wake()
+
+    def unregister(self, port):
+        """Stop reading a port, to be called before closing it."""
+        with self._lock:
+            try:
+                self._selector.unregister(port)
+            except (KeyError, ValueError):
+                pass
+
+    def _wake(self):
+        try:
+            os.write(self._wake_w, b"\0")
+        except BlockingIOError:
+            pass
+
+    def run(self):
+        """Read the registered ports until asked to stop."""
+        while not self.stop:
+            try:
+                events = self._selector.select(1.0)
+            except OSError:
+                self._log.exception("Exception caught in reactor")
+                continue
+            for key, mask in events:
+                if key.fd == self._wake_r:
+                    try:
+                        os.read(self._wake_r, self.read_size)
+                    except BlockingIOError:
+                        pass
+                    continue
+                with self._lock:
+                    # Skip ports unregistered since select() returned
+                    if self._selector.get_map().get(key.fd) is not key:
+                        continue
+                    self._read(key)
+
+    def _read(self, key):
+        """Read what a port has available and dispatch it."""
+        framer, on_read, on_error = key.data
+        try:
+            data = os.read(key.fd, self.read_size)
+            if not data:
+                raise OSError("device reports readiness to read but returned no data")
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self._selector.unregister(key.fileobj)
+            self._dispatch(on_error, e)
+            return
+
+        if framer is None:
+            self._dispatch(on_read, data)
+            return
+
+        lines = framer.feed(data)
+        if lines:
+            self._dispatch(on_read, lines)
+
+    def _dispatch(self, callback, arg):
+        try:
+            callback(arg)
+        except Exception:
+            self._log.exception("Exception caught in reactor callback")
+
+
+_reactor = None
+_reactor_lock = threading.Lock()
+
+def get_reactor():
+    """Return the reactor shared by all serial interfacers, started on first use."""
+    global _reactor
+    with _reactor_lock:
+        if _reactor is None:
+            _reactor = EmonHubReactor()
+            _reactor.start()
+        return _reactor
@@ -0,0 +1,102 @@
+"""
+
+  This code is released under the GNU Affero General Public License.
+
+  OpenEnergyMonitor project:
+  http://openenergymonitor.org
+
+"""
+
+import logging
+import threading
+
+"""class EmonHubRouter
+
+Moves cargo from the interfacers pub channels to the sub channels of the
+interfacers subscribed to them.
+
+The router sleeps until an interfacer publishes, then drains every pending
+cargo of every pub channel in one pass and wakes the subscribers, so bursts
+are delivered as they arrive rather than one cargo per hub loop.
+
+"""
+
+class EmonHubRouter(threading.Thread):
+
+    def __init__(self):
+        # Initialise logger
+        self._log = logging.getLogger("EmonHub")
+
+        # Initialise thread, daemonised so a failed hub start does not hang on exit
+        super().__init__(name="Router", daemon=True)
+
+        # Routing table, rebuilt by update() and replaced as a whole:
+        # sources is a list of (interfacer, pub channel name) pairs and
+        # subscribers maps a channel name to its subscribing interfacers
+        self._sources = []
+        self._subscribers = {}
+
+        # Set by interfacers when they publish
+        self._wakeup = threading.Event()
+
+        # create a stop
+        self.stop = False
+
+    def update(self, interfacers):
+        """Rebuild the routing table.
+
+        To be called whenever interfacers are created, deleted or have
+        their channel settings changed.
+
+        interfacers (dict): interfacers by name, as held by the hub
+
+        """
+        sources = []
+        subscribers = {}
+        for I in list(interfacers.values()):
+            for pub_channel in I._settings['pubchannels']:
+                sources.append((I, pub_channel))
+            for sub_channel in I._settings['subchannels']:
+                subscribers.setdefault(sub_channel, []).append(I)
+
+        # Replace rather than modify so route() always sees a consistent table
+        self._sources, self._subscribers = sources, subscribers
+        self._log.debug("Routing table: %s", {channel: [I.name for I in subs] for channel, subs in subscribers.items()})
+        self.notify()
+
+    def notify(self):
+        """Wake the router, called by interfacers after publishing."""
+        self._wakeup.set()
+
+    def run(self):
+        """Route cargo until asked to stop."""
+        while not self.stop:
+            # The timeout is only a safety net, publishing wakes the router
+            self._wakeup.wait(1.0)
+            self._wakeup.clear()
+            try:
+                self.route()
+            except Exception:
+                self._log.exception("Exception caught in router")
+
+    def route(self):
+        """Deliver every pending cargo to its subscribers."""
+
+        sources, subscribers = self._sources, self._subscribers
+
+        for I, pub_channel in sources:
+            channel_subscribers = subscribers.get(pub_channel, ())
+
+            channel = I._pub_channels.get(pub_channel)
+            if channel:
+                # Take everything published so far
+                batch = channel.get_all()
+
+                # Deliver cargo items to each subscriber
+                # (cargo on a channel nobody subscribes to is dropped)
+                for sub_interfacer in channel_subscribers:
+                    sub_interfacer.deliver(pub_channel, batch)
+
+            # Let the source know how full the sinks of this channel are
+            level = max((sub_interfacer.backpressure() for sub_interfacer in channel_subscribers), default=0)
+            I.set_backpressure(pub_channel, level)
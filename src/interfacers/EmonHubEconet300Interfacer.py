@@ -145,7 +145,7 @@ class EmonHubEconet300Interfacer(EmonHubInterfacer):
             cargo = self._fetch_data()
 
             # Poll timer reset after successful fetch
-            self._set_poll_timer(self._poll_interval)
+            self._set_poll_timer(self._poll_interval * self.read_interval_scale())
 
         except Exception as err2:
             # Log the detailed traceback for debugging
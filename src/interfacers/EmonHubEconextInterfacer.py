@@ -163,7 +163,7 @@ class EmonHubEconextInterfacer(EmonHubInterfacer):
             cargo = self._fetch()
 
             # Poll timer reset after successful fetch
-            self._set_poll_timer(self._settings["pollinterval"])
+            self._set_poll_timer(self._settings["pollinterval"] * self.read_interval_scale())
             self._consecutive_failures = 0
 
         except requests.exceptions.Timeout as err:
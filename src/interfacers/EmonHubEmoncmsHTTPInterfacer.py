@@ -1,14 +1,41 @@
 """class EmonHubEmoncmsHTTPInterfacer
 """
+import re
 import time
 import json
+import threading
 import requests
 import zlib
 from binascii import hexlify
+from urllib.parse import quote_plus
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from emonhub_interfacer import EmonHubInterfacer
 
 class EmonHubEmoncmsHTTPInterfacer(EmonHubInterfacer):
 
+    # Batch size adapts between min_batchsize and max_batchsize: doubled after
+    # a post quicker than fast_post_time (seconds) while a backlog is waiting,
+    # halved after one slower than slow_post_time, a timeout or a 5xx reply,
+    # and then kept at that halved size until the backlog is sent
+    fast_post_time = 2
+    slow_post_time = 10
+
+    # Compression level by batch size, (up to this many frames, level):
+    # small posts compress hardest, large backlogs quickest to spare the CPU
+    compress_levels = ((100, 9), (1000, 6))
+    compress_level_large = 1
+
+    # Frames serialized at a time when compressing
+    encode_frames = 500
+
+    # Posts back from the server, waiting in _inflight, see flush()
+    DELIVERED = 'delivered'
+    FAILED = 'failed'
+
+    # Finds anything but numbers in serialized frames, see _form_quote()
+    _not_numeric = re.compile(r'[^-0-9.e+,\[\]]').search
+
     def __init__(self, name):
         # Initialization
         super().__init__(name)
@@ -28,17 +55,226 @@ class EmonHubEmoncmsHTTPInterfacer(EmonHubInterfacer):
             'senddata': 1,
             'sendstatus': 0,
             'sendnames': 0,
-            'compress': 0
+            'compress': 0,
+            'max_inflight': 1,
+            'min_batchsize': 100,
+            'max_batchsize': 10000
         }
 
-        # set an absolute upper limit for number of items to process per post
-        self._item_limit = 1000
-
         # maximum buffer size
-        self.buffer._maximumEntriesInBuffer = 100000
+        self._buffer_settings['buffer_size'] = 100000
+        self.init_buffer()
 
         self.session = requests.Session()
 
+        # Posts run on worker threads so the interfacer keeps taking data in.
+        # Posts are [future, number of items] oldest first and cover the
+        # oldest items of the buffer in the same order. Once back, future is
+        # replaced by DELIVERED until the older posts are acknowledged, or by
+        # FAILED until the items are posted again.
+        self._executor = None
+        self._inflight = deque()
+        # Set while a backlog is being sent, posts then follow each other
+        # rather than waiting for the interval
+        self._draining = False
+        # Set when a post fails, until the posts in flight are all back
+        self._post_failed = False
+
+        # Current batch size, None until adapted from batchsize, and the
+        # size the server struggled with
+        self._batchsize = None
+        self._batchsize_ceiling = None
+        # min_batchsize and max_batchsize if configured, see _batchsize_bounds()
+        self._batchsize_bounds_set = set()
+        # Set by _process_post on the worker thread when the server looks overloaded
+        self._post_status = threading.local()
+        # Start time and number of frames sent of the backlog being drained
+        self._drain_start = None
+        self._drain_sent = 0
+
+    def run(self):
+        super().run()
+        if self._executor:
+            self._executor.shutdown(wait=False)
+
+    def action(self):
+        """Post as soon as possible while a backlog is being sent, otherwise every interval."""
+        if self._posting() or self._draining:
+            if str(self._settings['pause']).lower() in ['all', 'out']:
+                return
+            self.flush()
+        else:
+            super().action()
+
+    def _posting(self):
+        """Return the number of posts waiting for a reply."""
+        return sum(1 for post in self._inflight if isinstance(post[0], Future))
+
+    def flush(self):
+        """Acknowledge completed posts in order and keep up to max_inflight posts going."""
+
+        for post in self._inflight:
+            if isinstance(post[0], Future) and post[0].done():
+                # Raises the post's exception if it had one
+                success, duration, overloaded = post[0].result()
+                self._adapt_batchsize(success, duration, overloaded)
+                post[0] = self.DELIVERED if success else self.FAILED
+                if not success:
+                    # Post nothing until every post in flight is back, then retry the failed ones
+                    self._post_failed = True
+        # Acknowledge in order, a post delivered ahead of an older one waits for it
+        while self._inflight and self._inflight[0][0] is self.DELIVERED:
+            count = self._inflight.popleft()[1]
+            # In case of success, delete sample set from buffer
+            self.buffer.discardLastRetrievedItems(count)
+            self._drain_sent += count
+            self._retry.success()
+        posting = self._posting()
+        if self._post_failed:
+            if posting:
+                return
+            # slow down retry rate in the case where the last attempt failed
+            # stops continuous retry attempts filling up the log
+            self._post_failed = False
+            self._draining = False
+            self._log_drain("interrupted")
+            self._log.debug("%s retrying in %.0f s", self.name, self._retry.failure())
+            self._interval_timestamp = time.time()
+            return
+
+        max_items = self._current_batchsize()
+        if max_items <= 0:
+            return
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=int(self._settings['max_inflight']),
+                                                thread_name_prefix=self.name)
+
+        # A single trial post while the server is failing
+        max_inflight = int(self._settings['max_inflight']) if self._retry.state == 'closed' else 1
+
+        # Post failed items again first, oldest first, at most a batch at a
+        # time. Items delivered after them are not sent again.
+        offset = 0
+        retrying = False
+        for i in range(len(self._inflight)):
+            post = self._inflight[i]
+            if post[0] is self.FAILED:
+                if not post[1]:
+                    # Dropped from the buffer meanwhile
+                    post[0] = self.DELIVERED
+                elif posting < max_inflight:
+                    if post[1] > max_items:
+                        self._inflight.insert(i + 1, [self.FAILED, post[1] - max_items])
+                        post[1] = max_items
+                    databuffer = self.buffer.retrieveItems(post[1], offset)
+                    self._log.debug("Buffer size: %d, posting %d again from %d",
+                                    self.buffer.size(), len(databuffer), offset)
+                    post[0] = self._executor.submit(self._timed_post, databuffer)
+                    posting += 1
+                    self._interval_timestamp = time.time()
+                else:
+                    retrying = True
+            offset += post[1]
+
+        # Between intervals only a backlog of at least a full batch is sent,
+        # once started it is sent until nothing beyond the posts in flight waits
+        interval = int(self._settings['interval'])
+        due = not interval or time.time() - self._interval_timestamp >= interval
+        backlog = self._draining or self.buffer.size() - offset >= max_items
+        while not retrying and posting < max_inflight and (due or backlog):
+            databuffer = self.buffer.retrieveItems(max_items, offset)
+            if not databuffer:
+                break
+            self._log.debug("Buffer size: %d, posting %d from %d", self.buffer.size(), len(databuffer), offset)
+            self._inflight.append([self._executor.submit(self._timed_post, databuffer), len(databuffer)])
+            posting += 1
+            offset += len(databuffer)
+            # log the time of the last post
+            self._interval_timestamp = time.time()
+
+        # Keep posting without waiting for the interval while the backlog
+        # lasts or failed items wait for a post
+        draining = retrying or (backlog and self.buffer.size() > offset)
+        if draining and self._drain_start is None:
+            self._log.info("%s sending backlog of %d frames", self.name, self.buffer.size())
+            self._drain_start = time.time()
+            self._drain_sent = 0
+        elif self._drain_start is not None and not draining and not self._inflight:
+            self._log_drain("completed")
+            self._batchsize_ceiling = None
+        self._draining = draining
+
+    def _timed_post(self, databuffer):
+        """Post on a worker thread, return (success, seconds taken, server overloaded)."""
+        self._post_status.overloaded = False
+        st = time.time()
+        try:
+            success = self._process_post(databuffer)
+        except ValueError as e:
+            # A frame emoncms would reject, e.g. holding NaN. A persistent
+            # buffer would hand it back after every restart, so it is
+            # dropped and the rest of the batch is sent
+            frames = [frame for frame in databuffer if self._sendable(frame)]
+            self._log.error("%s discarding %d frames emoncms would reject: %s",
+                            self.name, len(databuffer) - len(frames), e)
+            success = self._process_post(frames) if frames else True
+        return success, time.time() - st, self._post_status.overloaded
+
+    def _sendable(self, frame):
+        """Return True if the frame can be serialized for emoncms."""
+        try:
+            self._encode_json([frame])
+        except ValueError:
+            return False
+        return True
+
+    def _current_batchsize(self):
+        """Return the adaptive batch size, starting from batchsize after set() resets it."""
+        if self._batchsize is None:
+            self._batchsize = self._bounded_batchsize(int(self._settings['batchsize']))
+        return self._batchsize
+
+    def _bounded_batchsize(self, batchsize):
+        minimum, maximum = self._batchsize_bounds()
+        return max(minimum, min(batchsize, maximum))
+
+    def _batchsize_bounds(self):
+        """Return min_batchsize and max_batchsize, those not configured widened to take in batchsize."""
+        batchsize = int(self._settings['batchsize'])
+        minimum = int(self._settings['min_batchsize'])
+        maximum = int(self._settings['max_batchsize'])
+        if 'min_batchsize' not in self._batchsize_bounds_set:
+            minimum = min(minimum, batchsize)
+        if 'max_batchsize' not in self._batchsize_bounds_set:
+            maximum = max(maximum, batchsize)
+        return minimum, maximum
+
+    def _adapt_batchsize(self, success, duration, overloaded):
+        """Grow the batch size while a backlog goes quickly, shrink it when the server struggles."""
+        batchsize = self._current_batchsize()
+        if overloaded or duration > self.slow_post_time:
+            batchsize //= 2
+            self._batchsize_ceiling = batchsize
+        elif success and self._draining and duration < self.fast_post_time:
+            if self._batchsize_ceiling is None:
+                batchsize *= 2
+            else:
+                batchsize = max(batchsize, min(batchsize * 2, self._batchsize_ceiling))
+        batchsize = self._bounded_batchsize(batchsize)
+        if batchsize != self._batchsize:
+            self._log.info("%s batch size %d (post took %.1f s%s)", self.name, batchsize, duration,
+                           ", server overloaded" if overloaded else "")
+            self._batchsize = batchsize
+
+    def _log_drain(self, outcome):
+        if self._drain_start is None:
+            return
+        duration = max(time.time() - self._drain_start, 0.001)
+        self._log.info("%s backlog %s: %d frames sent in %.1f s (%.0f frames/s, batch size %d)",
+                       self.name, outcome, self._drain_sent, duration, self._drain_sent / duration, self._current_batchsize())
+        self._drain_start = None
+
     def add(self, cargo):
         """Append data to buffer.
 
@@ -71,8 +307,84 @@ class EmonHubEmoncmsHTTPInterfacer(EmonHubInterfacer):
         except:
             self._log.warning("Failed to create emonCMS frame %s", f)
 
+        size = self.buffer.size()
         self.buffer.storeItem(f)
 
+        # A full buffer drops its oldest items, which may be in flight:
+        # their posts then acknowledge that many items fewer
+        dropped = size + 1 - self.buffer.size()
+        for post in self._inflight:
+            if dropped <= 0:
+                break
+            n = min(dropped, post[1])
+            post[1] -= n
+            dropped -= n
+
+    def _encode_json(self, databuffer):
+        """Return the JSON array of frames."""
+
+        # Set allow_nan=False as NaN would be rejected by emoncms.  NaN now
+        # causes a ValueError exception, on which _timed_post() discards the
+        # frames holding NaN (e.g. from LeChacal RPICT7V1) rather than letting
+        # them block the emonhub buffer with no data getting to EmonCMS.
+        return json.dumps(databuffer, separators=(',', ':'), allow_nan=False)
+
+    def _encode_frames(self, databuffer):
+        """Yield the JSON array of frames a slice at a time."""
+        yield '['
+        for i in range(0, len(databuffer), self.encode_frames):
+            if i:
+                yield ','
+            yield self._encode_json(databuffer[i:i + self.encode_frames])[1:-1]
+        yield ']'
+
+    def _form_quote(self, text):
+        """Escape serialized frames for a form post.
+
+        Frames of numbers only hold a handful of characters that need
+        escaping, replacing those is four times quicker than quote_plus.
+
+        """
+        if self._not_numeric(text):
+            return quote_plus(text)
+        return text.replace(',', '%2C').replace('[', '%5B').replace(']', '%5D').replace('+', '%2B')
+
+    def _compress_frames(self, databuffer, wbits, prefix='', quote=None, sizes=None):
+        """Serialize the frames straight into a compressor, yielding the compressed chunks.
+
+        Only the compressed chunk being sent is held in memory, never the
+        whole JSON string or body. wbits selects the zlib (15) or gzip (31)
+        container and quote escapes the JSON for a form post.
+
+        sizes (list): if given, [JSON size, compressed size] counted as the
+        chunks are yielded
+
+        """
+        if sizes is None:
+            sizes = [0, 0]
+        level = self.compress_level_large
+        for frames, frames_level in self.compress_levels:
+            if len(databuffer) <= frames:
+                level = frames_level
+                break
+        compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+        chunk = compressor.compress(prefix.encode())
+        for text in self._encode_frames(databuffer):
+            # An empty chunk would end a chunked transfer
+            if chunk:
+                sizes[1] += len(chunk)
+                yield chunk
+            sizes[0] += len(text)
+            if quote:
+                text = quote(text)
+            chunk = compressor.compress(text.encode())
+        if chunk:
+            sizes[1] += len(chunk)
+            yield chunk
+        chunk = compressor.flush()
+        sizes[1] += len(chunk)
+        yield chunk
+
     def _process_post(self, databuffer):
         """Send data to server."""
 
@@ -88,13 +400,6 @@ class EmonHubEmoncmsHTTPInterfacer(EmonHubInterfacer):
         if self._settings['senddata']:
             number_of_frames = len(databuffer)
             
-            # Set allow_nan=False as NaN would be rejected by emoncms.  NaN now
-            # causes ValueError exception which is unhandled, causing emonhub to
-            # exit and be restarted by supervisord which is preferable to a NaN
-            # from LeChacal RPICT7V1 blocking emonhub buffer and no data getting to
-            # EmonCMS.
-            data_string = json.dumps(databuffer, separators=(',', ':'), allow_nan=False)
-            
             # Prepare URL string of the form
             # http://domain.tld/emoncms/input/bulk.json?apikey=12345
             # &data=[[0,10,82,23],[5,10,82,23],[10,10,82,23]]
@@ -107,39 +412,67 @@ class EmonHubEmoncmsHTTPInterfacer(EmonHubInterfacer):
             post_url = self._settings['url'] + '/input/bulk.json?sentat='+str(sentat)
             
             # If sendnames enabled then always compress:
-            if self._settings['sendnames']:
-                self._settings['compress'] = True
-            
-            # Compress if enabled
-            if self._settings['compress']:
-                json_str_size = len(data_string)
-                # Compress data and encode as hex string.
-                compressed = zlib.compress(data_string.encode())
-                compression_ratio = len(compressed) / json_str_size
-                # Only use compression if it makes sense!
-                if compression_ratio<1.0:
-                    post_body = compressed
-                    # Set compression flag (cb = compression binary).
-                    post_url = post_url + "&cb=1"
-                    self._log.info("sending: %s (%d bytes of data, %d frames, compressed)", post_url, len(post_body),number_of_frames)
-                    self._log.info("compression ratio: %d%%",compression_ratio*100)
-                else: 
-                    post_body = {'data': data_string}
-                    self._log.info("sending: %s (%d bytes of data, %d frames, uncompressed)", post_url, len(data_string),number_of_frames)
-                    self._log.info("compression ratio: %d%%, sent original",compression_ratio*100)
-            else: 
-                post_body = {'data': data_string}
+            if self._settings['sendnames'] and not self._settings['compress']:
+                self._settings['compress'] = 'zlib'
+
+            headers = {'Authorization': 'Bearer '+self._settings['apikey']}
+            compress = self._settings['compress']
+            post_body = None
+            if compress:
+                sizes = [0, 0]
+                cb = ''
+                if compress == 'gzip':
+                    # Standard Content-Encoding, decoded by the web server in
+                    # front of emoncms into the usual form post
+                    chunks = self._compress_frames(databuffer, 31, 'data=', self._form_quote, sizes)
+                    headers['Content-Type'] = 'application/x-www-form-urlencoded'
+                    headers['Content-Encoding'] = 'gzip'
+                else:
+                    # Raw zlib stream flagged with cb=1 (cb = compression binary)
+                    chunks = self._compress_frames(databuffer, zlib.MAX_WBITS, sizes=sizes)
+                    cb = "&cb=1"
+                if number_of_frames > self.encode_frames:
+                    # Streamed, requests sends a generator with chunked
+                    # transfer-encoding as it is compressed. Batches this
+                    # large always compress, the ratio is logged once sent.
+                    post_body = chunks
+                    post_url = post_url + cb
+                    self._log.info("sending: %s (%d frames, %s compressed, streamed)", post_url, number_of_frames, compress)
+                else:
+                    # Small enough to compress first, only use compression if it makes sense!
+                    post_body = b''.join(chunks)
+                    compression_ratio = sizes[1] / sizes[0]
+                    if compression_ratio<1.0:
+                        post_url = post_url + cb
+                        self._log.info("sending: %s (%d bytes of data, %d frames, %s compressed)", post_url, len(post_body), number_of_frames, compress)
+                        self._log.info("compression ratio: %d%%",compression_ratio*100)
+                    else:
+                        post_body = None
+                        headers.pop('Content-Encoding', None)
+                        self._log.info("compression ratio: %d%%, sending original",compression_ratio*100)
+                del chunks
+            if post_body is None:
+                data_string = self._encode_json(databuffer)
+                # Form encoded here rather than by requests, see _form_quote()
+                post_body = ('data=' + self._form_quote(data_string)).encode()
+                headers['Content-Type'] = 'application/x-www-form-urlencoded'
                 self._log.info("sending: %s (%d bytes of data, %d frames, uncompressed)", post_url, len(data_string),number_of_frames)
-            
+
             result = False
             try:
                 st = time.time()
-                reply = self.session.post(post_url, post_body, timeout=60, headers={'Authorization': 'Bearer '+self._settings['apikey']})
+                reply = self.session.post(post_url, post_body, timeout=60, headers=headers)
                 dt = (time.time()-st)*1000
+                if compress and not isinstance(post_body, bytes):
+                    self._log.info("sent %d bytes of data, compression ratio: %d%%", sizes[1], sizes[1] / sizes[0] * 100)
                 reply.raise_for_status()  # Raise an exception if status code isn't 200
                 result = reply.text
             except requests.exceptions.RequestException as ex:
                 self._log.warning("%s couldn't send to server: %s", self.name, ex)
+                # Timeouts and 5xx replies mean smaller batches, see _adapt_batchsize()
+                response = getattr(ex, 'response', None)
+                self._post_status.overloaded = isinstance(ex, requests.exceptions.Timeout) \
+                    or (response is not None and response.status_code >= 500)
                 return False
 
             if result == 'ok':
@@ -170,8 +503,15 @@ class EmonHubEmoncmsHTTPInterfacer(EmonHubInterfacer):
         :return:
         """
 
+        batchsize = str(self._settings['batchsize'])
+
         super().set(**kwargs)
 
+        # batchsize is where the adaptive batch size starts from, restart
+        # only when it changes as set() is called on every config reload
+        if str(self._settings['batchsize']) != batchsize:
+            self._batchsize = None
+
         for key, setting in self._cms_settings.items():
             #valid = False
             if key not in kwargs:
@@ -211,8 +551,51 @@ class EmonHubEmoncmsHTTPInterfacer(EmonHubInterfacer):
                 self._settings[key] = bool(int(setting))
                 continue
             elif key == 'compress':
-                self._log.info("Setting " + self.name + " compress: " + str(setting))
-                self._settings[key] = bool(int(setting))
+                # 1 or zlib: zlib body flagged with cb=1, gzip: Content-Encoding: gzip
+                setting = str(setting).lower()
+                if setting not in ['0', '1', 'zlib', 'gzip']:
+                    self._log.warning("'%s' is not valid for %s: %s", setting, self.name, key)
+                    continue
+                self._log.info("Setting " + self.name + " compress: " + setting)
+                self._settings[key] = {'0': 0, '1': 'zlib'}.get(setting, setting)
+                continue
+            elif key in ['min_batchsize', 'max_batchsize']:
+                if not str(setting).isdigit() or int(setting) < 1:
+                    self._log.warning("'%s' is not valid for %s: %s", setting, self.name, key)
+                    continue
+                # Stored as int, the config gives a string
+                if self._settings.get(key) == int(setting):
+                    continue
+                self._log.info("Setting %s %s: %s", self.name, key, setting)
+                self._settings[key] = int(setting)
+                # Start again from batchsize within the new bounds
+                self._batchsize = None
+                continue
+            elif key == 'max_inflight':
+                if not str(setting).isdigit() or int(setting) < 1:
+                    self._log.warning("'%s' is not valid for %s: %s", setting, self.name, key)
+                    continue
+                # Stored as int, the config gives a string
+                if self._settings.get(key) == int(setting):
+                    continue
+                self._log.info("Setting %s max_inflight: %s", self.name, setting)
+                self._settings[key] = int(setting)
+                if self._executor:
+                    # Posts in flight complete on the old pool
+                    self._executor.shutdown(wait=False)
+                    self._executor = None
                 continue
             else:
                 self._log.warning("'%s' is not valid for %s: %s", setting, self.name, key)
+
+        # Configured bounds win over batchsize, say so when they change it
+        self._batchsize_bounds_set = {key for key in ('min_batchsize', 'max_batchsize') if key in kwargs}
+        if self._batchsize is None:
+            batchsize = int(self._settings['batchsize'])
+            minimum, maximum = self._batchsize_bounds()
+            if batchsize < minimum:
+                self._log.warning("%s batchsize %d is below min_batchsize %d, starting from %d",
+                                  self.name, batchsize, minimum, minimum)
+            elif batchsize > maximum:
+                self._log.warning("%s batchsize %d is above max_batchsize %d, starting from %d",
+                                  self.name, batchsize, maximum, maximum)
@@ -42,7 +42,7 @@ class EmonHubGoodWeInterfacer(EmonHubInterfacer):
     
     def read(self):
         # Request GoodWe data at user specified interval
-        if time.time() - self._last_time >= self._settings['readinterval']:
+        if time.time() - self._last_time >= self._settings['readinterval'] * self.read_interval_scale():
             self._last_time = time.time()
 
             # If URL is set, fetch the SOC
@@ -96,8 +96,7 @@ class EmonHubGraphiteInterfacer(EmonHubInterfacer):
         self._log.debug("Sending metrics: %s", message)
 
         try:
-            sock = socket.socket()
-            sock.connect((host, port))
+            sock = socket.create_connection((host, port), timeout=60)
             sock.sendall(message.encode())
             sock.close()
         except socket.error as e:
@@ -105,7 +105,7 @@ class EmonHubInfluxInterfacer(EmonHubInterfacer):
         params = {'db': self.init_settings['influx_db'], 'u': self.init_settings['influx_user'], 'p': self.init_settings['influx_passwd']}
 
         try:
-            requests.post(url, params=params, data=message)
+            requests.post(url, params=params, data=message, timeout=60)
         except requests.exceptions.RequestException as e:
             self._log.error(e)
             return False
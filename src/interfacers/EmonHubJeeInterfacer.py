@@ -26,11 +26,9 @@ class EmonHubJeeInterfacer(ehi.EmonHubSerialInterfacer):
         self.info = ["", ""]
         if self._ser is not None:
             self._ser.write(b"v")
-            time.sleep(2)  # FIXME sleep in initialiser smells
-            self._rx_buf = self._rx_buf + self._ser.readline().decode()
-            if '\r\n' in self._rx_buf:
-                self._rx_buf = ""
-                info = self._rx_buf + self._ser.readline().decode()[:-2]
+            # The first line is the echo, the second the info
+            if self._readline(timeout=2) is not None:
+                info = self._readline(timeout=1) or ""
                 if info != "":
                     # Split the returned "info" string into firmware version & current settings
                     self.info[0] = info.strip().split(' ')[0]
@@ -43,8 +41,7 @@ class EmonHubJeeInterfacer(ehi.EmonHubSerialInterfacer):
                     self._log.info("%s device firmware version & configuration: not available", self.name)
             else:
                 self._log.warning("Device communication error - check settings")
-        self._rx_buf = ""
-        self._ser.flushInput()
+        self._discard_input()
 
         # Initialize settings
         self._defaults.update({'pause': 'off', 'interval': 0, 'datacode': 'h'})
@@ -80,22 +77,12 @@ class EmonHubJeeInterfacer(ehi.EmonHubSerialInterfacer):
 
         """
 
-        # Read serial RX
-        try:
-            self._rx_buf = self._rx_buf + self._ser.readline().decode()
-        except UnicodeDecodeError:
-            return
-
-        # If line incomplete, exit
-        if '\r\n' not in self._rx_buf:
+        # Next line received, if any
+        f = self._readline()
+        if f is None:
             return
 
-        # Remove CR,LF.
-        f = self._rx_buf[:-2].strip()
-
-        # Reset buffer
-        self._rx_buf = ''
-
+        f = f.strip()
         if not f:
             return
 
@@ -571,7 +571,7 @@ class EmonHubMBUSInterfacer(EmonHubInterfacer):
 
         """
 
-        if int(time.time()) % self._settings['read_interval'] == 0:
+        if int(time.time()) % (self._settings['read_interval'] * self.read_interval_scale()) == 0:
             if self.next_interval:
                 self.next_interval = False
                 
@@ -222,7 +222,7 @@ class EmonHubMinimalModbusInterfacer(EmonHubInterfacer):
 
         """
 
-        if int(time.time())%self._settings['read_interval']==0:
+        if int(time.time())%(self._settings['read_interval']*self.read_interval_scale())==0:
             if self.next_interval:
                 self.next_interval = False
 
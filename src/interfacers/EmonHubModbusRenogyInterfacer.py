@@ -93,7 +93,7 @@ class EmonHubModbusRenogyInterfacer(EmonHubInterfacer):
 
         """ Read registers from client"""
         if pymodbus_found:
-            time.sleep(float(self._settings["interval"]))
+            time.sleep(float(self._settings["interval"]) * self.read_interval_scale())
                        
             if not self._modcon :
                 self.close()
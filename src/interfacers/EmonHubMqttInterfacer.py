@@ -34,8 +34,16 @@ Example emonhub configuration
         node_JSON_enable = 1
         node_JSON_basetopic = emon/JSON/
 
+        # QoS of each format (0, 1 or 2), number of QoS 1 and 2 messages
+        # waiting for the broker to acknowledge them and number held
+        # before new ones are dropped
+        # nodevar_format_qos = 0
+        # max_inflight = 100
+        # max_queued = 1000
+
 """
 import time
+import logging
 import paho.mqtt.client as mqtt
 from emonhub_interfacer import EmonHubInterfacer
 import Cargo
@@ -43,6 +51,12 @@ import json
 
 class EmonHubMqttInterfacer(EmonHubInterfacer):
 
+    # Longest time (seconds) flush() spends publishing a backlog in one loop
+    flush_time = 0.5
+
+    # Topics cached before the cache is emptied and rebuilt
+    topic_cache_size = 1000
+
     def __init__(self, name, mqtt_user=" ", mqtt_passwd=" ", mqtt_host="127.0.0.1", mqtt_port=1883,
                  mqtt_tls_enabled=False, mqtt_tls_ca_certs="", mqtt_tls_certfile="",
                  mqtt_tls_keyfile="", mqtt_tls_insecure=False):
@@ -54,9 +68,13 @@ class EmonHubMqttInterfacer(EmonHubInterfacer):
         super().__init__(name)
 
         # set the default setting values for this interfacer
-        self._defaults.update({'datacode': '0'})
+        self._defaults.update({'datacode': '0', 'batchsize': '100'})
         self._settings.update(self._defaults)
 
+        # Frames are held while the broker is unreachable
+        self._buffer_settings['buffer_size'] = 10000
+        self.init_buffer()
+
         # Add any MQTT specific settings
         self._mqtt_settings = {
             # emonhub/rx/10/values format - default emoncms nodes module
@@ -69,7 +87,17 @@ class EmonHubMqttInterfacer(EmonHubInterfacer):
 
             # JSON format
             'node_JSON_enable': 0,
-            'node_JSON_basetopic': "emon/"
+            'node_JSON_basetopic': "emon/",
+
+            # QoS of each format
+            'node_format_qos': 2,
+            'nodevar_format_qos': 2,
+            'node_JSON_qos': 2,
+
+            # QoS 1 and 2 messages waiting for an acknowledgement,
+            # and held in all before publishing fails
+            'max_inflight': 20,
+            'max_queued': 1000
         }
         self._settings.update(self._mqtt_settings)
 
@@ -87,11 +115,22 @@ class EmonHubMqttInterfacer(EmonHubInterfacer):
 
         self._connected = False
 
+        # QoS of the nodevar, node and JSON formats, None if disabled, and
+        # their topics by node, both rebuilt by set()
+        self._formats = (None, None, None)
+        self._topics = {}
+        # The oldest frame if only some of its messages were queued, and
+        # how many, see _publish_frame()
+        self._partial = (None, 0)
+
         self._mqttc = mqtt.Client()
         self._mqttc.on_connect = self.on_connect
         self._mqttc.on_disconnect = self.on_disconnect
         self._mqttc.on_message = self.on_message
         self._mqttc.on_subscribe = self.on_subscribe
+        self._mqttc.on_connect_fail = self.on_connect_fail
+        # Bounds the messages waiting for the network thread, see run()
+        self._mqttc.max_queued_messages_set(self._mqtt_settings['max_queued'])
 
         # Configure TLS/SSL if enabled
         if str(self.init_settings['mqtt_tls_enabled']).lower() in ['true', '1', 'yes']:
@@ -127,118 +166,171 @@ class EmonHubMqttInterfacer(EmonHubInterfacer):
         if cargo.rssi:
             f['rssi'] = cargo.rssi
 
-        # This basic QoS level 1 MQTT interfacer does not require buffering
-        # therefore we call _process_post here directly with an array
-        # containing only the one frame.
+        # Published by flush() from the buffer, which holds frames while
+        # the broker is unreachable and replays them in order
+        self.buffer.storeItem(f)
+
 
-        # _process_post will never be called from the emonhub_interfacer
-        # run > action > flush > _process_post chain as the buffer will
-        # always be empty.
+    def run(self):
+        """Run the interfacer with paho's network loop on a thread of its own.
 
-        # This is a bit of a hack, the final approach is currently being considered
-        # as part of ongoing discussion on future direction of emonhub
+        The network thread connects and reconnects, exchanges acknowledgements
+        and keepalives and delivers incoming messages as soon as they arrive.
+        Messages published from this thread are queued for it by paho, up to
+        max_queued of them.
 
-        self._process_post([f])
+        """
+        self._log.info("Connecting to MQTT Server")
+        self._mqttc.username_pw_set(self.init_settings['mqtt_user'], self.init_settings['mqtt_passwd'])
+        self._mqttc.connect_async(self.init_settings['mqtt_host'], int(self.init_settings['mqtt_port']), 60)
+        self._mqttc.loop_start()
 
-        # To re-enable buffering comment the above three lines and uncomment the following
-        # note that at preset _process_post will not handle buffered data correctly and
-        # no time is transmitted to the subscribing clients
+        super().run()
 
-        # self.buffer.storeItem(f)
+        self._mqttc.disconnect()
+        self._mqttc.loop_stop()
 
+    def flush(self):
+        """Publish buffered frames oldest first, a batch at a time.
 
-    def _process_post(self, databuffer):
-        if not self._connected:
-            self._log.info("Connecting to MQTT Server")
-            try:
-                self._mqttc.username_pw_set(self.init_settings['mqtt_user'], self.init_settings['mqtt_passwd'])
-                self._mqttc.connect(self.init_settings['mqtt_host'], int(self.init_settings['mqtt_port']), 60)
-            except Exception:
-                self._log.info("Could not connect...")
-                time.sleep(1.0)  # FIXME why sleep? we're just about to return True
+        After an outage the backlog is replayed in batches of batchsize
+        frames for up to flush_time seconds per loop.
 
-        else:
-            frame = databuffer[0]
-            nodename = frame['node']
-            nodeid = frame['nodeid']
-
-            # ----------------------------------------------------------
-            # General MQTT format: emonhub/rx/emonpi/power1 ... 100
-            # ----------------------------------------------------------
-            if int(self._settings["nodevar_format_enable"]) == 1:
-                # FIXME replace with zip
-                for i in range(len(frame['data'])):
-                    inputname = str(i + 1)
-                    if i < len(frame['names']):
-                        inputname = frame['names'][i]
-                    value = frame['data'][i]
-
-                    # Construct topic
-                    topic = self._settings["nodevar_format_basetopic"] + nodename + "/" + inputname
-                    payload = str(value)
-
-                    self._log.debug("Publishing: %s %s", topic, payload)
-                    result = self._mqttc.publish(topic, payload=payload, qos=2, retain=False)
-
-                    if result[0] == 4:
-                        self._log.info("Publishing error? returned 4")
-                        return False
-
-                # send rssi
-                if 'rssi' in frame:
-                    topic = self._settings["nodevar_format_basetopic"] + nodename + "/rssi"
-                    payload = str(frame['rssi'])
-
-                    self._log.debug("Publishing: %s %s", topic, payload)
-                    result = self._mqttc.publish(topic, payload=payload, qos=2, retain=False)
-
-                    if result[0] == 4:
-                        self._log.info("Publishing error? returned 4")
-                        return False
-
-            # ----------------------------------------------------------
-            # Emoncms nodes module format: emonhub/rx/10/values ... 100,200,300
-            # ----------------------------------------------------------
-            if int(self._settings["node_format_enable"]) == 1:
-                topic = self._settings["node_format_basetopic"] + "rx/" + str(nodeid) + "/values"
-
-                payload = ",".join(map(str, frame['data']))
-
-                if 'rssi' in frame:
-                    payload = payload + "," + str(frame['rssi'])
-
-                self._log.info("Publishing 'node' formatted msg")
-                self._log.debug("Publishing: %s %s", topic, payload)
-                result = self._mqttc.publish(topic, payload=payload, qos=2, retain=False)
+        """
+        deadline = time.time() + self.flush_time
+        while self._connected and self.buffer.hasItems() and time.time() < deadline:
+            databuffer = self.buffer.retrieveItems(int(self._settings['batchsize']))
+            published = self._publish_frames(databuffer)
+            self.buffer.discardLastRetrievedItems(published)
+            self._interval_timestamp = time.time()
+            if published < len(databuffer):
+                # The rest are kept for the next loop, e.g. once paho's queue has room
+                break
 
-                if result[0] == 4:
-                    self._log.info("Publishing error? returned 4")
-                    return False
+    def _process_post(self, databuffer):
+        return self._publish_frames(databuffer) == len(databuffer)
 
-            # ----------------------------------------------------------
-            # Emoncms JSON format: <basetopic>/<nodeid> {"key":Value, ... "time":<timestamp>}
-            # ----------------------------------------------------------
-            if int(self._settings["node_JSON_enable"]) == 1:
-                topic = self._settings["node_JSON_basetopic"] + nodename
-                payload = dict(zip(frame['names'], frame['data']))
-                payload['time'] = frame['timestamp']
-                if 'rssi' in frame:
-                    payload['rssi'] = frame['rssi']
+    def _publish_frames(self, databuffer):
+        """Publish frames in order, return how many were published."""
+        if not self._connected:
+            return 0
+
+        for published, frame in enumerate(databuffer):
+            if not self._publish_frame(frame):
+                return published
+
+        return len(databuffer)
+
+    def _publish(self, topic, payload, qos):
+        """Publish a message, return False if it could not be queued."""
+        result = self._mqttc.publish(topic, payload=payload, qos=qos, retain=False)
+        if result[0] == mqtt.MQTT_ERR_QUEUE_SIZE:
+            self._log.debug("%d messages already queued, publishing again later", int(self._settings['max_queued']))
+            return False
+        if result[0] == 4:
+            self._log.info("Publishing error? returned 4")
+            return False
+        return True
 
-                payloadJSON = json.dumps(payload)
+    def _publish_frame(self, frame):
+        """Publish a frame in each enabled format, return False on error.
 
-                self._log.debug("Publishing: " + topic + " " + payloadJSON)
-                result = self._mqttc.publish(topic, payload=payloadJSON, qos=2, retain=False)
+        A frame cut short, e.g. by paho's queue being full, is resumed
+        after its last queued message the next time it is published.
 
-                if result[0] == 4:
-                    self._log.info("Publishing error? returned 4")
-                    return False
+        """
+        # Messages of this frame queued by an earlier call
+        partial_frame, queued = self._partial
+        if partial_frame != frame:
+            queued = 0
+        debug = self._log.isEnabledFor(logging.DEBUG)
+
+        for index, (topic, payload, qos) in enumerate(self._frame_messages(frame)):
+            if index < queued:
+                continue
+            if debug:
+                self._log.debug("Publishing: %s %s", topic, payload)
+            if not self._publish(topic, payload, qos):
+                self._partial = (frame, index)
+                return False
 
+        self._partial = (None, 0)
         return True
 
-    def action(self):
-        self._mqttc.loop(0)
+    def _frame_messages(self, frame):
+        """Yield the (topic, payload, qos) of each message of a frame."""
+        nodevar_qos, node_qos, json_qos = self._formats
+
+        # ----------------------------------------------------------
+        # General MQTT format: emonhub/rx/emonpi/power1 ... 100
+        # ----------------------------------------------------------
+        if nodevar_qos is not None:
+            topics = self._nodevar_topics(frame)
+            for topic, value in zip(topics, frame['data']):
+                yield topic, str(value), nodevar_qos
+
+            # send rssi
+            if 'rssi' in frame:
+                yield topics[-1], str(frame['rssi']), nodevar_qos
+
+        # ----------------------------------------------------------
+        # Emoncms nodes module format: emonhub/rx/10/values ... 100,200,300
+        # ----------------------------------------------------------
+        if node_qos is not None:
+            key = ('node', frame['nodeid'])
+            topic = self._topics.get(key)
+            if topic is None:
+                topic = self._cache_topic(key,
+                                          self._settings["node_format_basetopic"] + "rx/" + str(frame['nodeid']) + "/values")
+
+            payload = ",".join(map(str, frame['data']))
+
+            if 'rssi' in frame:
+                payload = payload + "," + str(frame['rssi'])
+
+            yield topic, payload, node_qos
+
+        # ----------------------------------------------------------
+        # Emoncms JSON format: <basetopic>/<nodeid> {"key":Value, ... "time":<timestamp>}
+        # ----------------------------------------------------------
+        if json_qos is not None:
+            key = ('json', frame['node'])
+            topic = self._topics.get(key)
+            if topic is None:
+                topic = self._cache_topic(key, self._settings["node_JSON_basetopic"] + frame['node'])
+            payload = dict(zip(frame['names'], frame['data']))
+            payload['time'] = frame['timestamp']
+            if 'rssi' in frame:
+                payload['rssi'] = frame['rssi']
+
+            yield topic, json.dumps(payload), json_qos
+
+    def _nodevar_topics(self, frame):
+        """Return the topic of each value of a frame, then the rssi topic."""
+        key = ('nodevar', frame['node'], tuple(frame['names']), len(frame['data']))
+        topics = self._topics.get(key)
+        if topics is None:
+            base = self._settings["nodevar_format_basetopic"] + frame['node'] + "/"
+            names = frame['names']
+            topics = [base + (names[i] if i < len(names) else str(i + 1)) for i in range(len(frame['data']))]
+            topics.append(base + "rssi")
+            self._cache_topic(key, topics)
+        return topics
+
+    def _cache_topic(self, key, topic):
+        """Cache topics by format and nodeid (node format), nodename (JSON
+        format) or nodename, names and number of values (nodevar format).
+
+        Many sources use the node name as nodeid, the format keeps the
+        node and JSON topics of such nodes apart.
+
+        """
+        if len(self._topics) >= self.topic_cache_size:
+            self._topics.clear()
+        self._topics[key] = topic
+        return topic
 
+    def action(self):
         # pause output if 'pause' set to 'all' or 'out'
         if 'pause' in self._settings \
                 and str(self._settings['pause']).lower() in ['all', 'out']:
@@ -264,18 +356,25 @@ class EmonHubMqttInterfacer(EmonHubInterfacer):
 
         if rc:
             self._log.warning(connack_string[rc])
+            self._retry.failure()
         else:
             self._log.info("connection status: %s", connack_string[rc])
             self._connected = True
+            self._retry.success()
             # Subscribe to MQTT topics
             self._mqttc.subscribe(str(self._settings["node_format_basetopic"]) + "tx/#")
 
         self._log.debug("CONACK => Return code: %d", rc)
 
+    def on_connect_fail(self, client, userdata):
+        self._log.info("Could not connect, retrying in up to %d s", self._retry.max_interval)
+        self._retry.failure()
+
     def on_disconnect(self, client, userdata, rc):
         if rc != 0:
             self._log.info("Unexpected disconnection")
-            self._connected = False
+        # Frames stay in the buffer until the connection is back
+        self._connected = False
 
     def on_subscribe(self, mqttc, obj, mid, granted_qos):
         self._log.info("on_subscribe")
@@ -300,21 +399,14 @@ class EmonHubMqttInterfacer(EmonHubInterfacer):
                     if rxc:
                         # rxc = self._process_tx(rxc)
                         if rxc:
-                            for channel in self._settings["pubchannels"]:
-                            
-                                # Initialize channel if needed
-                                if not channel in self._pub_channels:
-                                    self._pub_channels[channel] = []
-                                    
-                                # Add cargo item to channel
-                                self._pub_channels[channel].append(rxc)
-                                
-                                self._log.debug(str(rxc.uri) + " Sent to channel' : " + str(channel))
-                                
+                            self.publish(rxc)
 
     def set(self, **kwargs):
         super().set(**kwargs)
 
+        # paho reconnects by itself, with the same backoff as other sinks
+        self._mqttc.reconnect_delay_set(self._retry.interval, self._retry.max_interval)
+
         for key, setting in self._mqtt_settings.items():
             if key not in kwargs:
                 setting = self._mqtt_settings[key]
@@ -346,5 +438,26 @@ class EmonHubMqttInterfacer(EmonHubInterfacer):
                 self._log.info("Setting " + self.name + " node_JSON_basetopic: " + setting)
                 self._settings[key] = setting
                 continue
+            elif key in ['node_format_qos', 'nodevar_format_qos', 'node_JSON_qos'] and str(setting) in ['0', '1', '2']:
+                self._log.info("Setting %s %s: %s", self.name, key, setting)
+                self._settings[key] = int(setting)
+                continue
+            elif key == 'max_inflight' and str(setting).isdigit() and int(setting) > 0:
+                self._log.info("Setting %s max_inflight: %s", self.name, setting)
+                self._settings[key] = int(setting)
+                self._mqttc.max_inflight_messages_set(int(setting))
+                continue
+            elif key == 'max_queued' and str(setting).isdigit() and int(setting) > 0:
+                self._log.info("Setting %s max_queued: %s", self.name, setting)
+                self._settings[key] = int(setting)
+                self._mqttc.max_queued_messages_set(int(setting))
+                continue
             else:
                 self._log.warning("'%s' is not valid for %s: %s", setting, self.name, key)
+
+        # Parse the format settings once rather than for every frame
+        self._formats = tuple(int(self._settings[fmt + '_qos']) if int(self._settings[fmt + '_enable']) == 1 else None
+                              for fmt in ('nodevar_format', 'node_format', 'node_JSON'))
+        self._topics = {}
+        # The messages of a frame cut short may differ now, publish it whole
+        self._partial = (None, 0)
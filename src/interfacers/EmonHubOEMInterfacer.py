@@ -27,7 +27,6 @@ class EmonHubOEMInterfacer(ehi.EmonHubSerialInterfacer):
         # Display device firmware version and current settings
         self.info = ["", ""]
 
-        self._rx_buf = ""
         # self._ser.flushInput()
 
         # Initialize settings
@@ -167,9 +166,9 @@ class EmonHubOEMInterfacer(ehi.EmonHubSerialInterfacer):
         return c
 
     def read(self):
-        """Read data from serial port and process if complete line received.
+        """Read data from serial port and process the complete lines received.
 
-        Return data as a list: [NodeID, val1, val2]
+        Return a list of cargo, one per valid data line: [NodeID, val1, val2]
 
         """
 
@@ -181,26 +180,17 @@ class EmonHubOEMInterfacer(ehi.EmonHubSerialInterfacer):
         if not self._ser:
             return
 
-        # Read serial RX
-        try:
-            ser_data = self._ser.readline()
-            self._rx_buf = self._rx_buf + ser_data.decode()
-        except UnicodeDecodeError:
-            return
-        except Exception as e:
-            self._log.error(e)
-            self._ser = False
-
-        # If line incomplete, exit
-        if '\r\n' not in self._rx_buf:
-            return
+        cargos = []
+        for f in self._read_lines():
+            c = self._read_line(f)
+            if c:
+                cargos.append(c)
+        return cargos
 
-        # Remove CR,LF.
-        f = self._rx_buf[:-2].strip()
-
-        # Reset buffer
-        self._rx_buf = ''
+    def _read_line(self, f):
+        """Process a line received, return cargo if it holds valid data."""
 
+        f = f.strip()
         if not f:
             return
 
@@ -261,13 +251,10 @@ class EmonHubOEMInterfacer(ehi.EmonHubSerialInterfacer):
     def send_cmd(self, cmd):
         self._ser.write((cmd+"\n").encode())
         # Wait for reply
-        rx_buf = ""
-        start = time.time()
-        while time.time() - start < 1.0:
-            rx_buf = rx_buf + self._ser.readline().decode()
-            if '\r\n' in rx_buf:
-                return rx_buf.strip()
-        return False
+        reply = self._readline(timeout=1.0)
+        if reply is None:
+            return False
+        return reply.strip()
 
     def check_config_format(self):
         self._config_format = "new"
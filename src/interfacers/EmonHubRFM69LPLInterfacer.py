@@ -116,6 +116,8 @@ class EmonHubRFM69LPLInterfacer(EmonHubInterfacer):
     def read(self):
         """Read data from RFM69
 
+        Returns every packet received since the last read, as a list
+
         """
         if not self.radio.init_success:
             return False
@@ -124,26 +126,31 @@ class EmonHubRFM69LPLInterfacer(EmonHubInterfacer):
         if self.polling_mode:
             self.radio._interruptHandler(self.interruptPin)
 
+        # Drain the packets queued by the radio so they are processed as one batch
+        cargos = []
         packet = self.radio.get_packet()
-        if packet:
+        while packet:
             self._log.info("Packet received "+str(len(packet.data))+" bytes")
             # Make sure packet is a unique new packet rather than a 2nd or 3rd retry attempt
             if packet.sender==self.last_packet_nodeid and packet.data==self.last_packet_data and (time.time()-self.last_packet_time)<0.5:
                 self._log.info("Discarding duplicate packet")
-                return False
-
-            self.last_packet_nodeid = packet.sender
-            self.last_packet_data = packet.data
-            self.last_packet_time = time.time()
-            # Process packet
-            c = Cargo.new_cargo(rawdata='')
-            c.nodeid = packet.sender
-            c.realdata = packet.data
-            c.rssi = packet.RSSI
+            else:
+                self.last_packet_nodeid = packet.sender
+                self.last_packet_data = packet.data
+                self.last_packet_time = time.time()
+                # Process packet
+                c = Cargo.new_cargo(rawdata='')
+                c.nodeid = packet.sender
+                c.realdata = packet.data
+                c.rssi = packet.RSSI
+                cargos.append(c)
 
             # Set watchdog timer
             self.last_received = time.time()
-            return c
+            packet = self.radio.get_packet()
+
+        if cargos:
+            return cargos
 
         if self.last_received and (time.time()-self.last_received) > self.watchdog_period:
             self._log.warning("No radio packets received in last "+str(self.watchdog_period)+" seconds, restarting radio")
@@ -1,5 +1,7 @@
+import queue
 import serial
 from emonhub_interfacer import EmonHubInterfacer
+from emonhub_reactor import get_reactor
 
 import Cargo
 
@@ -7,10 +9,19 @@ import Cargo
 
 Monitors the serial port for data
 
+The port is read by the shared reactor, which queues complete lines for
+read() and wakes the interfacer as they arrive.
+
 """
 
 class EmonHubSerialInterfacer(EmonHubInterfacer):
 
+    # Line ending sent by the device
+    rx_delimiter = b"\r\n"
+
+    # Lines kept for read(), the oldest are dropped once it is full
+    rx_queue_size = 1000
+
     def __init__(self, name, com_port='', com_baud=9600):
         """Initialize interfacer
 
@@ -23,19 +34,27 @@ class EmonHubSerialInterfacer(EmonHubInterfacer):
 
         self._connect_failure_count = 0
 
+        # Lines received by the reactor, or the error that closed the port
+        self._rx_lines = queue.Queue(self.rx_queue_size)
+        self._rx_dropped = 0
+
         # Open serial port
         self._ser = self._open_serial_port(com_port, com_baud)
 
-        # Initialize RX buffer
-        self._rx_buf = ''
+    def run(self):
+        """Run the interfacer, then release the port for a replacement."""
+        super().run()
+        self.close()
 
     def close(self):
         """Close serial port"""
 
         # Close serial port
-        if self._ser is not None:
+        if self._ser:
             self._log.debug("Closing serial port")
+            get_reactor().unregister(self._ser)
             self._ser.close()
+            self._ser = False
 
     def _open_serial_port(self, com_port, com_baud):
         """Open serial port
@@ -51,6 +70,7 @@ class EmonHubSerialInterfacer(EmonHubInterfacer):
             s = serial.Serial(com_port, com_baud, timeout=0)
             self._log.debug("Opening serial port: %s @ %s bits/s", com_port, com_baud)
             self._connect_failure_count = 0
+            get_reactor().register(s, self._on_lines, self._on_error, self.rx_delimiter)
         except serial.SerialException as e:
             self._connect_failure_count += 1
             if self._connect_failure_count==1:
@@ -60,39 +80,107 @@ class EmonHubSerialInterfacer(EmonHubInterfacer):
             # raise EmonHubInterfacerInitError('Could not open COM port %s' % com_port)
         return s
 
+    def _on_lines(self, lines):
+        """Queue lines received by the reactor and wake the interfacer."""
+        for line in lines:
+            self._queue_rx(line)
+        self._wakeup.set()
+
+    def _on_error(self, error):
+        """Queue the error that made the reactor drop the port."""
+        self._queue_rx(error)
+        self._wakeup.set()
+
+    def _queue_rx(self, item):
+        """Queue without blocking the reactor, dropping the oldest line if full."""
+        while True:
+            try:
+                self._rx_lines.put_nowait(item)
+                return
+            except queue.Full:
+                pass
+            try:
+                self._rx_lines.get_nowait()
+            except queue.Empty:
+                continue
+            self._rx_dropped += 1
+            if self._rx_dropped == 1 or self._rx_dropped % self.rx_queue_size == 0:
+                self._log.warning("%s RX queue full, %d lines dropped", self.name, self._rx_dropped)
+
+    def _readline(self, timeout=0):
+        """Return the next line received, without its line ending.
+
+        timeout (float): seconds to wait for a line, e.g. a command reply
+
+        Return None if no line is available. If the port failed it is
+        closed and self._ser set to False, so interfacers that reconnect
+        reopen it.
+
+        """
+        while True:
+            try:
+                line = self._rx_lines.get(timeout=timeout) if timeout else self._rx_lines.get_nowait()
+            except queue.Empty:
+                return None
+
+            # Keep the run loop going while lines are queued
+            if not self._rx_lines.empty():
+                self._wakeup.set()
+
+            if isinstance(line, Exception):
+                self._log.error("Serial port error: %s", line)
+                if self._ser:
+                    self._ser.close()
+                self._ser = False
+                return None
+
+            try:
+                return line.decode()
+            except UnicodeDecodeError:
+                self._log.debug("Discarding line that is not valid text: %s", line)
+
+    def _read_lines(self):
+        """Yield every line received so far."""
+        line = self._readline()
+        while line is not None:
+            yield line
+            line = self._readline()
+
+    def _discard_input(self):
+        """Drop any input received but not read yet."""
+        if self._ser:
+            self._ser.reset_input_buffer()
+        while self._readline() is not None:
+            pass
+
     def read(self):
-        """Read data from serial port and process if complete line received.
+        """Read data from serial port and process the complete lines received.
 
-        Return data as a list: [NodeID, val1, val2]
+        Return a list of cargo, one per line: [NodeID, val1, val2]
 
         """
 
         if not self._ser:
             return False
 
-        # Read serial RX
-        self._rx_buf = self._rx_buf + self._ser.readline().decode()
-
-        # If line incomplete, exit
-        if '\r\n' not in self._rx_buf:
-            return
-
-        # Remove CR,LF
-        f = self._rx_buf[:-2]
+        nodeoffset = int(self._settings['nodeoffset'])
 
-        # Reset buffer
-        self._rx_buf = ''
+        cargos = []
+        for f in self._read_lines():
+            # Create a Payload object
+            c = Cargo.new_cargo(rawdata=f)
 
-        # Create a Payload object
-        c = Cargo.new_cargo(rawdata=f)
+            f = f.split()
+            if not f:
+                continue
 
-        f = f.split()
+            if nodeoffset:
+                c.nodeid = nodeoffset
+                c.realdata = f
+            else:
+                c.nodeid = int(f[0])
+                c.realdata = f[1:]
 
-        if int(self._settings['nodeoffset']):
-            c.nodeid = int(self._settings['nodeoffset'])
-            c.realdata = f
-        else:
-            c.nodeid = int(f[0])
-            c.realdata = f[1:]
+            cargos.append(c)
 
-        return c
+        return cargos
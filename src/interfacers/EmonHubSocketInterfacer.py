@@ -1,6 +1,7 @@
 import socket
 import select
 from emonhub_interfacer import EmonHubInterfacer
+from emonhub_reactor import EmonHubLineFramer
 import Cargo
 
 """class EmonHubSocketInterfacer
@@ -29,7 +30,7 @@ class EmonHubSocketInterfacer(EmonHubInterfacer):
         self._socket = self._open_socket(int(port_nb))
 
         # Initialize RX buffer for socket
-        self._sock_rx_buf = ''
+        self._sock_rx_buf = EmonHubLineFramer()
 
     def _open_socket(self, port_nb):
         """Open a socket
@@ -58,12 +59,14 @@ class EmonHubSocketInterfacer(EmonHubInterfacer):
             self._socket.close()
 
     def read(self):
-        """Read data from socket and process if complete line received.
+        """Read data from socket and process the complete lines received.
 
-        Return data as a list: [NodeID, val1, val2]
+        Return a list of cargo, one per valid line: [NodeID, val1, val2]
 
         """
 
+        lines = []
+
         # Check if data received
         ready_to_read, ready_to_write, in_error = \
             select.select([self._socket], [], [], 0)
@@ -74,18 +77,27 @@ class EmonHubSocketInterfacer(EmonHubInterfacer):
             # Accept connection
             conn, addr = self._socket.accept()
 
-            # Read data
-            self._sock_rx_buf = self._sock_rx_buf + conn.recv(1024).decode("utf-8")
+            # Read data, keeping every complete frame
+            lines = self._sock_rx_buf.feed(conn.recv(1024))
 
             # Close connection
             conn.close()
 
-        # If there is at least one complete frame in the buffer
-        if '\r\n' not in self._sock_rx_buf:
-            return
+        cargos = []
+        for line in lines:
+            if not line:
+                continue
+            try:
+                c = self._read_line(line.decode("utf-8"))
+            except UnicodeDecodeError:
+                self._log.warning("Discarded frame: not valid UTF-8")
+                continue
+            if c:
+                cargos.append(c)
+        return cargos
 
-        # Process and return first frame in buffer:
-        f, self._sock_rx_buf = self._sock_rx_buf.split('\r\n', 1)
+    def _read_line(self, f):
+        """Process a frame received, return cargo if it is valid."""
 
         # create a new cargo
         c = Cargo.new_cargo(rawdata=f)
@@ -14,6 +14,9 @@ Monitors the serial port for data from 'Serial Format 2' type devices
 
 class EmonHubSunampInterfacer(ehi.EmonHubSerialInterfacer):
 
+    # Lines may end in '\n' only, any '\r' is stripped by read()
+    rx_delimiter = b"\n"
+
     def __init__(self, name, com_port='/dev/ttyUSB0', com_baud=115200):
         """Initialize Interfacer
 
@@ -27,7 +30,6 @@ class EmonHubSunampInterfacer(ehi.EmonHubSerialInterfacer):
         # Display device firmware version and current settings
         self.info = ["", ""]
 
-        self._rx_buf = ""
         # self._ser.flushInput()
 
         # Initialize settings
@@ -53,26 +55,12 @@ class EmonHubSunampInterfacer(ehi.EmonHubSerialInterfacer):
         if not self._ser:
             return
 
-        # Read serial RX
-        try:
-            ser_data = self._ser.readline()
-            self._rx_buf = self._rx_buf + ser_data.decode()
-        except UnicodeDecodeError:
-            return
-        except Exception as e:
-            self._log.error(e)
-            self._ser = False
-
-        # If line incomplete, exit
-        if '\n' not in self._rx_buf:
+        # Next line received, if any
+        f = self._readline()
+        if f is None:
             return
 
-        # Remove CR,LF.
-        f = self._rx_buf[:-1].strip()
-
-        # Reset buffer
-        self._rx_buf = ''
-
+        f = f.strip()
         if not f:
             return
 
@@ -28,7 +28,7 @@ class EmonHubTeslaPowerWallInterfacer(EmonHubInterfacer):
 
     def read(self):
         # Request Power Wall data at user specified interval
-        if time.time() - self._last_time >= self._settings['readinterval']:
+        if time.time() - self._last_time >= self._settings['readinterval'] * self.read_interval_scale():
             self._last_time = time.time()
 
             # If URL is set, fetch the SOC
@@ -1,18 +1,26 @@
 import time
+import queue
 import serial
 import Cargo
 from emonhub_interfacer import EmonHubInterfacer
+from emonhub_reactor import get_reactor
 
 class EmonHubVEDirectInterfacer(EmonHubInterfacer):
     """class EmonhubSerialInterfacer
 
     Monitors the serial port for data
 
+    The shared reactor reads the port in raw mode, the bytes are parsed
+    as they arrive and the latest packet is kept for read().
+
     """
 
 
     WAIT_HEADER, IN_KEY, IN_VALUE, IN_CHECKSUM = range(4)
 
+    # Reads kept for read(), the oldest are dropped once it is full
+    rx_queue_size = 100
+
     def __init__(self, name, com_port='', com_baud=9600, toextract='', poll_interval=30):
         """Initialize interfacer
 
@@ -23,6 +31,12 @@ class EmonHubVEDirectInterfacer(EmonHubInterfacer):
         # Initialization
         super().__init__(name)
 
+        # Bytes received by the reactor, or the error that closed the port
+        self._rx_chunks = queue.Queue(self.rx_queue_size)
+
+        # Latest complete packet
+        self._packet = None
+
         # Open serial port
         self._ser = self._open_serial_port(com_port, com_baud)
 
@@ -87,13 +101,20 @@ class EmonHubVEDirectInterfacer(EmonHubInterfacer):
         else:
             raise RuntimeError("Impossible state")
 
+    def run(self):
+        """Run the interfacer, then release the port for a replacement."""
+        super().run()
+        self.close()
+
     def close(self):
         """Close serial port"""
 
         # Close serial port
         if self._ser is not None:
             self._log.debug("Closing serial port")
+            get_reactor().unregister(self._ser)
             self._ser.close()
+            self._ser = None
 
     def _open_serial_port(self, com_port, com_baud):
         """Open serial port
@@ -104,10 +125,31 @@ class EmonHubVEDirectInterfacer(EmonHubInterfacer):
         """
         try:
             self._log.debug("Opening serial port: %s @ %s bits/s", com_port, com_baud)
-            return serial.Serial(com_port, com_baud, timeout=10)
+            s = serial.Serial(com_port, com_baud, timeout=0)
+            get_reactor().register(s, self._on_bytes, self._on_bytes, delimiter=None)
+            return s
         except serial.SerialException:
             self._log.exception("Open error")
 
+    def _on_bytes(self, data):
+        """Queue bytes, or the port error, received by the reactor.
+
+        Never blocks the reactor: if read() falls behind the oldest bytes
+        are dropped, the packet they belonged to then fails its checksum.
+
+        """
+        while True:
+            try:
+                self._rx_chunks.put_nowait(data)
+                break
+            except queue.Full:
+                pass
+            try:
+                self._rx_chunks.get_nowait()
+            except queue.Empty:
+                pass
+        self._wakeup.set()
+
     def parse_package(self, data):
         """
         Convert package from vedirect dictionary format to emonhub expected format
@@ -127,32 +169,41 @@ class EmonHubVEDirectInterfacer(EmonHubInterfacer):
         return clean_data
 
     def _read_serial(self):
-        self._log.debug("Starting Serial read from %s", self._ser)
-        try:
-            while self._ser:
-                # Read one byte at a time from the serial port and pass it into
-                # the input FSM until we have a complete packet, then return it
-                packet = self.input(self._ser.read())
-                if packet is not None:
-                    return packet
-        except Exception:  # FIXME Too general Exception. Maybe SerialException?
-            self._log.exception("Read error")
+        """Pass the bytes received so far into the input FSM, one at a
+        time, keeping the latest valid packet."""
+        while True:
+            try:
+                data = self._rx_chunks.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(data, Exception):
+                self._log.error("Read error: %s", data)
+                self._ser.close()
+                self._ser = None
+                break
+            for i in range(len(data)):
+                packet = self.input(data[i:i + 1])
+                if packet:
+                    self._packet = packet
 
     def read(self):
         """Read data from serial port and process if complete line received.
         """
 
+        # Parse what has arrived, even between polls
+        self._read_serial()
+
         now = time.time()
         if now - self.last_read <= self.poll_interval:
             #self._log.debug("Waiting for %d seconds ", now - self.last_read)
             # Wait to read based on poll_interval
             return
 
-        rx_buf = self._read_serial()
-        self.last_read = now
-        # If _read_serial raised an exception or returned empty dict, exit
-        if not rx_buf:
+        # If no valid packet was received yet, exit
+        if not self._packet:
             return
+        rx_buf, self._packet = self._packet, None
+        self.last_read = now
 
         #Sample data looks like {'FW': '0307', 'SOC': '1000', 'Relay': 'OFF', 'PID': '0x203', 'H10': '6', 'BMV': '700', 'TTG': '-1', 'H12': '0', 'H18': '0', 'I': '0', 'H11': '0', 'Alarm': 'OFF', 'CE': '0', 'H17': '9', 'P': '0', 'AR': '0', 'V': '26719', 'H8': '29011', 'H9': '0', 'H2': '0', 'H3': '0', 'H1': '-1633', 'H6': '-5775', 'H7': '17453', 'H4': '0', 'H5': '0'}
 
@@ -77,7 +77,7 @@ class EmonModbusTcpInterfacer(EmonHubInterfacer):
     def read(self):
         """ Read registers from client"""
         if self.pymodbus_found:
-            time.sleep(float(self._settings["interval"]))
+            time.sleep(float(self._settings["interval"]) * self.read_interval_scale())
             f = []
             c = Cargo.new_cargo(rawdata="")
             # valid datacodes list and number of registers associated
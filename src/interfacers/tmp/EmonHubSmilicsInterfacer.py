@@ -64,13 +64,7 @@ class EmonHubSmilicsInterfacer(EmonHubInterfacer):
                 if rxc:
                     rxc = self._process_rx(rxc)
                     if rxc:
-                        for channel in self._settings["pubchannels"]:
-                            self._log.debug("%d Sent to channel(start)' : %s", rxc.uri, channel)
-
-                            # Add cargo item to channel
-                            self._pub_channels.setdefault(channel, []).append(rxc)
-
-                            self._log.debug("%d Sent to channel(end)' : %s", rxc.uri, channel)
+                        self.publish(rxc)
 
             # Don't loop too fast
             time.sleep(0.1)